@@ -1,553 +1,1085 @@
-import tkinter as tk
 import random
 import math
+from collections import deque
+import argparse
+import csv
+import json
 import os
 import sys
+import time
+import tracemalloc
 
 WINDOW_HEIGHT = 600
 WINDOW_WIDTH = 600
 
 CANNON_Y = 550
+CANNON_SPEED = 4  # pixels per tick while an arrow key is held
+FIRE_INTERVAL = 150  # ms between player shots
+MAX_QUEUED_SHOTS = 2  # fire presses kept while the gun is reloading
+RELEASE_DEBOUNCE_MS = 30  # X11 sends each OS key repeat as a release and a press
 
 ENEMY_SPACE_X = 100
 ENEMY_SPACE_Y = 40
 ENEMY_MOVE_SPACE_X = 20
 ENEMY_MOVE_SPEED = 500
 NUMBER_OF_ENEMY = 10
+ENEMY_COLUMNS = 5
 ENEMY_SHOOT_INTERVAL = 1000
+ENEMY_SCORE = 100
+ENEMY_MARGIN_X = 25  # closest a UFO centre gets to the side walls
+ENEMY_COLORS = ["#FF6B6B", "#FFA500", "#FFD700", "#FF1493", "#FF4500"]
+
+# Wave layouts: one string per row, "1".."5" picks ENEMY_COLORS, "." is a gap
+WAVES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "invader_waves.json")
 
 BULLET_HEIGHT = 10
 BULLET_WIDTH = 5
-BULLET_SPEED = 10
+BULLET_VELOCITY = 1.0  # pixels per ms
+BULLET_STEP = 30  # ms between bullet updates; hits are swept, so no tunnelling
+MY_BULLET_CAPACITY = 32
+ENEMY_BULLET_CAPACITY = 256  # canvas items are only created for slots that get used
+
+# Hitboxes relative to the entity centre: (left, top, right, bottom)
+ENEMY_HITBOX = (-20, -5, 20, 10)  # saucer body
+CANNON_HITBOX = (-12, -25, 12, 5)  # fuselage
+
+MAX_PARTICLES = 256  # hard cap; the oldest particle is evicted beyond this
+PARTICLE_GRAVITY = 0.3
+
+SHAKE_MARGIN = 20  # scroll room around the play field for the shaking camera
+TWEEN_STEP = 20  # ms between tween updates, also the shake jitter rate
+BACKGROUND_COLOR = "#0A0A1A"  # fading effects end at this colour
 
 TEXT_GOOD_SIZE = 10
 TEXT_CONGRATULATIONS_SIZE = 50
 TEXT_GAMECLEAR_SIZE = 60
 TEXT_GAMEOVER_SIZE = 90
 
-cannon_x = WINDOW_WIDTH // 2
-cannon_y = CANNON_Y
-cannon_id = None
-cannon_glow_id = None
-cannon_exist = True
+GLOW_FRAMES = 4  # cached steps of the pulsing glow rings
+ENGINE_COLORS = ["#00FFFF", "#00DDFF", "#00BBFF", "#0099FF"]
+
+TICK_MS = 10  # fixed simulation timestep
+MAX_CATCH_UP_TICKS = 5  # ticks run at most per frame when the loop falls behind
+
+# Instrumentation: F3 toggles the overlay, F4 writes the CSV trace
+PROFILE_ENV = "INVADER_PROFILE"  # set to 1 to start with the overlay on
+TRACE_ENV = "INVADER_TRACE"  # CSV path for the trace (also written on exit)
+DEFAULT_TRACE_PATH = "invader_trace.csv"
+PROFILE_WINDOW = 300  # frames used for averages and percentiles
+TRACE_FRAMES = 20000  # frames kept in memory for the CSV trace
+PROBE_EVERY = 15  # frames between canvas/after probes and overlay redraws
+
+REPLAY_VERSION = 5
+BENCH_TICKS = 3000
+ENDLESS_WAVE_TICKS = 1000  # ticks each wave is held for in the endless load test
+BENCH_SEED = 1234
+
+# Quality governor: effect detail per tier, best first. Trail values are the
+# chance of a trail particle per bullet step. Frame work time is the
+# ticks plus the render call; Tk redraws the canvas outside it, so the budget
+# leaves part of the TICK_MS frame free for that
+QUALITY_TIERS = (
+    {"name": "high", "explosion": 12, "my_trail": 0.6, "enemy_trail": 0.45,
+     "glow": True, "stars": 15},
+    {"name": "medium", "explosion": 8, "my_trail": 0.3, "enemy_trail": 0.24,
+     "glow": True, "stars": 10},
+    {"name": "low", "explosion": 4, "my_trail": 0.15, "enemy_trail": 0.0,
+     "glow": False, "stars": 5},
+    {"name": "minimal", "explosion": 2, "my_trail": 0.0, "enemy_trail": 0.0,
+     "glow": False, "stars": 0},
+)
+QUALITY_BUDGET_MS = 6.0  # step down while the average frame is slower
+QUALITY_HEADROOM_MS = 2.5  # step back up while it is faster
+QUALITY_SMOOTHING = 0.1  # weight of the newest frame in the moving average
+QUALITY_COOLDOWN = 30  # frames to wait after a change before stepping down again
+QUALITY_RESTORE_FRAMES = 180  # frames of headroom needed before stepping up
+
+# ===== タイマー管理 =====
+# Scopes: "engine" timers and systems live as long as the window. "game"
+# ones belong to one round: reset_game cancels the game timers (pending key
+# releases) and InvaderSim.reset unregisters the game systems (the
+# formation's march and fire).
+class TimerRegistry:
+    """Owns every root.after callback so a whole scope can be cancelled at once"""
+    def __init__(self, root):
+        self.root = root
+        self.timers = {}  # after id -> scope
+
+    def after(self, scope, ms, fn):
+        def fire():
+            self.timers.pop(timer_id, None)
+            fn()
+        timer_id = self.root.after(ms, fire)
+        self.timers[timer_id] = scope
+        return timer_id
+
+    def cancel(self, timer_id):
+        if self.timers.pop(timer_id, None) is not None:
+            self.root.after_cancel(timer_id)
+
+    def cancel_scope(self, scope):
+        for timer_id, timer_scope in list(self.timers.items()):
+            if timer_scope == scope:
+                self.cancel(timer_id)
+
+    def counts(self):
+        """Live callbacks per scope"""
+        counts = {}
+        for scope in self.timers.values():
+            counts[scope] = counts.get(scope, 0) + 1
+        return counts
+
+# ===== ゲームループ (固定タイムステップ) =====
+class TickScheduler:
+    """Steps every registered system at a fixed timestep
+
+    step() is pure Python; start() drives it from a single after() loop
+    owned by a TimerRegistry.
+    """
+    def __init__(self, tick_ms=TICK_MS, max_catch_up=MAX_CATCH_UP_TICKS):
+        self.tick_ms = tick_ms
+        self.max_catch_up = max_catch_up
+        self.systems = {}  # name -> (fn, every_n_ticks, scope)
+        self.tick_count = 0
+        self.accumulator = 0.0
+        self.last_time = None
+        self.after_id = None
+        self.timers = None
+        self.profiler = None  # FrameProfiler while instrumentation is on
+        self.governor = None  # QualityGovernor fed with every frame's work time
+
+    def register_system(self, name, fn, interval_ms=None, scope="engine"):
+        """Run fn every interval_ms (rounded to whole ticks); re-registering a name replaces it"""
+        if interval_ms is None:
+            interval_ms = self.tick_ms
+        every = max(1, round(interval_ms / self.tick_ms))
+        self.systems[name] = (fn, every, scope)
+
+    def unregister_system(self, name):
+        self.systems.pop(name, None)
+
+    def unregister_scope(self, scope):
+        for name, system in list(self.systems.items()):
+            if system[2] == scope:
+                del self.systems[name]
+
+    def counts(self):
+        """Registered systems per scope"""
+        counts = {}
+        for _, _, scope in self.systems.values():
+            counts[scope] = counts.get(scope, 0) + 1
+        return counts
+
+    def step(self):
+        """Advance the simulation by exactly one tick"""
+        self.tick_count += 1
+        profiler = self.profiler
+        for name, (fn, every, _) in list(self.systems.items()):
+            if self.tick_count % every == 0 and name in self.systems:
+                if profiler is None:
+                    fn()
+                else:
+                    start = time.perf_counter()
+                    fn()
+                    profiler.add(name, (time.perf_counter() - start) * 1000)
+
+    def start(self, timers, tick_fn=None, frame_fn=None):
+        """Drive tick_fn (default: step) at the fixed rate, then frame_fn once per frame"""
+        self.timers = timers
+        self.tick_fn = tick_fn or self.step
+        self.frame_fn = frame_fn
+        self.last_time = time.perf_counter()
+        self.accumulator = 0.0
+        self.after_id = timers.after("engine", self.tick_ms, self._frame)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.timers.cancel(self.after_id)
+            self.after_id = None
+
+    def _frame(self):
+        now = time.perf_counter()
+        self.accumulator += (now - self.last_time) * 1000
+        self.last_time = now
+        steps = 0
+        while self.accumulator >= self.tick_ms and steps < self.max_catch_up:
+            self.tick_fn()
+            self.accumulator -= self.tick_ms
+            steps += 1
+        if self.accumulator >= self.tick_ms:
+            # Too far behind: drop the backlog instead of spiralling
+            self.accumulator = 0.0
+        if self.frame_fn is not None:
+            render_start = time.perf_counter()
+            self.frame_fn()
+            if self.profiler is not None:
+                self.profiler.add("render", (time.perf_counter() - render_start) * 1000)
+        frame_ms = (time.perf_counter() - now) * 1000
+        if self.profiler is not None:
+            self.profiler.end_frame(frame_ms, steps)
+        if self.governor is not None:
+            self.governor.observe(frame_ms)
+        delay = max(1, int(self.tick_ms - self.accumulator))
+        self.after_id = self.timers.after("engine", delay, self._frame)
+
+# ===== 計測 (フレーム時間) =====
+class FrameProfiler:
+    """Per-subsystem and per-frame timings for the overlay and the CSV trace
+
+    probes maps a name to a callable sampled every PROBE_EVERY frames, e.g.
+    the live canvas item count.
+    """
+    def __init__(self, window=PROFILE_WINDOW, trace_frames=TRACE_FRAMES):
+        self.current = {}
+        self.history = deque(maxlen=window)  # per-frame {system: ms}
+        self.frame_ms = deque(maxlen=window)
+        self.trace = deque(maxlen=trace_frames)
+        self.probes = {}
+        self.probe_values = {}
+        self.frame_count = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, name, ms):
+        self.current[name] = self.current.get(name, 0.0) + ms
+
+    def end_frame(self, total_ms, ticks):
+        self.frame_count += 1
+        if self.probes and self.frame_count % PROBE_EVERY == 1:
+            self.probe_values = {name: probe() for name, probe in self.probes.items()}
+        frame = self.current
+        self.current = {}
+        self.history.append(frame)
+        self.frame_ms.append(total_ms)
+        row = dict(frame)
+        row["frame_total"] = total_ms
+        row["ticks"] = ticks
+        row.update(self.probe_values)
+        self.trace.append((self.frame_count, time.perf_counter() - self.start_time, row))
+
+    def percentiles(self, *ps):
+        ordered = sorted(self.frame_ms)
+        if not ordered:
+            return [0.0 for _ in ps]
+        return [ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] for p in ps]
+
+    def system_averages(self):
+        """Mean ms per frame for each subsystem over the window, slowest first"""
+        totals = {}
+        for frame in self.history:
+            for name, ms in frame.items():
+                totals[name] = totals.get(name, 0.0) + ms
+        frames = max(1, len(self.history))
+        return sorted(((name, total / frames) for name, total in totals.items()),
+                      key=lambda item: -item[1])
+
+    def summary_lines(self):
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        lines = [f"frame p50 {p50:5.2f} p95 {p95:5.2f} p99 {p99:5.2f} ms"]
+        if self.probe_values:
+            lines.append("  ".join(f"{name} {value}" for name, value in self.probe_values.items()))
+        for name, ms in self.system_averages():
+            lines.append(f"{name:<14}{ms:6.3f}")
+        return lines
+
+    def dump_csv(self, path):
+        """Write the trace in long format: one row per frame and metric"""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "time_s", "metric", "value"])
+            for frame, t, row in self.trace:
+                for metric, value in row.items():
+                    if isinstance(value, float):
+                        value = round(value, 4)
+                    writer.writerow([frame, f"{t:.4f}", metric, value])
+
+# ===== 画質の自動調整 =====
+class QualityGovernor:
+    """Moves through QUALITY_TIERS from the moving average of frame work time
 
-enemies = []
-my_bullets = []
-enemy_bullets = []
-particles = []
-stars = []
-screen_shake_offset = [0, 0]
-glow_phase = 0
+    on_change(settings) is called with the new tier's settings.
+    """
+    def __init__(self, budget_ms=QUALITY_BUDGET_MS, headroom_ms=QUALITY_HEADROOM_MS):
+        self.budget_ms = budget_ms
+        self.headroom_ms = headroom_ms
+        self.tier = 0
+        self.average_ms = 0.0
+        self.frames_since_change = 0
+        self.on_change = None
+
+    @property
+    def settings(self):
+        return QUALITY_TIERS[self.tier]
+
+    def observe(self, frame_ms):
+        self.average_ms += (frame_ms - self.average_ms) * QUALITY_SMOOTHING
+        self.frames_since_change += 1
+        if self.frames_since_change < QUALITY_COOLDOWN:
+            return
+        if self.average_ms > self.budget_ms and self.tier < len(QUALITY_TIERS) - 1:
+            self.set_tier(self.tier + 1)
+        elif (self.average_ms < self.headroom_ms and self.tier > 0
+              and self.frames_since_change >= QUALITY_RESTORE_FRAMES):
+            self.set_tier(self.tier - 1)
+
+    def set_tier(self, tier):
+        self.tier = tier
+        self.frames_since_change = 0
+        if self.on_change is not None:
+            self.on_change(self.settings)
+
+    def describe(self):
+        return f"{self.settings['name']} ({self.average_ms:.1f}ms)"
+
+# ===== 弾のプール =====
+class BulletPool:
+    """Fixed-capacity bullet storage; slots are reused and addressed by handles"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.prev_y = [0.0] * capacity  # y before the last move, for swept tests
+        self.alive = [False] * capacity
+        self.generation = [0] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def spawn(self, x, y):
+        """Take a free slot and return its handle, or None if the pool is full"""
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        self.x[slot] = x
+        self.y[slot] = y
+        self.prev_y[slot] = y
+        self.alive[slot] = True
+        return (slot, self.generation[slot])
+
+    def get(self, handle):
+        """Return the slot for a handle, or None if it is stale or released"""
+        slot, generation = handle
+        if self.generation[slot] != generation or not self.alive[slot]:
+            return None
+        return slot
+
+    def release(self, handle):
+        slot = self.get(handle)
+        if slot is None:
+            return
+        self.alive[slot] = False
+        self.generation[slot] += 1
+        self.free.append(slot)
+
+    def move(self, slot, dy):
+        self.prev_y[slot] = self.y[slot]
+        self.y[slot] += dy
+
+    def swept_box(self, slot):
+        """Box covering the whole path of the last move
+
+        Bullets only move vertically, so the segment-vs-AABB test reduces to
+        an overlap test against the union of the start and end boxes.
+        """
+        x = self.x[slot]
+        y0 = self.prev_y[slot]
+        y1 = self.y[slot]
+        return (x - BULLET_WIDTH, min(y0, y1) - BULLET_HEIGHT,
+                x + BULLET_WIDTH, max(y0, y1) + BULLET_HEIGHT)
+
+    def handles(self):
+        """Handles of all live bullets"""
+        return [(slot, self.generation[slot])
+                for slot in range(self.capacity) if self.alive[slot]]
+
+    def clear(self):
+        for slot in range(self.capacity):
+            if self.alive[slot]:
+                self.generation[slot] += 1
+            self.alive[slot] = False
+        self.free = list(range(self.capacity - 1, -1, -1))
 
 # ===== Particle System =====
-class Particle:
-    def __init__(self, x, y, vx, vy, color, size, lifetime):
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
-        self.color = color
-        self.size = size
-        self.lifetime = lifetime
-        self.age = 0
-        self.id = cv.create_oval(
-            x - size, y - size, x + size, y + size,
-            fill=color, outline=""
-        )
-    
+class ParticleEngine:
+    """Struct-of-arrays particle storage: one plain list per field
+
+    serial[slot] changes every time a slot is reused so a renderer can tell
+    a recycled slot from one that merely moved.
+    """
+    def __init__(self, capacity=MAX_PARTICLES):
+        self.capacity = capacity
+        # Lists, not array.array: the update loop is per slot in pure Python,
+        # and every array read or write would box a fresh float
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.vx = [0.0] * capacity
+        self.vy = [0.0] * capacity
+        self.size = [0.0] * capacity
+        self.age = [0] * capacity
+        self.lifetime = [0] * capacity
+        self.serial = [0] * capacity
+        self.color = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.live = []  # live slots, oldest first
+
+    def __len__(self):
+        return len(self.live)
+
+    def emit(self, x, y, vx, vy, color, size, lifetime):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            # Pool is full: recycle the oldest live particle
+            slot = self.live.pop(0)
+        self.x[slot] = x
+        self.y[slot] = y
+        self.vx[slot] = vx
+        self.vy[slot] = vy
+        self.size[slot] = size
+        self.age[slot] = 0
+        self.lifetime[slot] = lifetime
+        self.serial[slot] += 1
+        self.color[slot] = color
+        self.live.append(slot)
+
     def update(self):
-        self.age += 1
-        self.x += self.vx
-        self.y += self.vy
-        self.vy += 0.3  # gravity
-        alpha = 1 - (self.age / self.lifetime)
-        if alpha <= 0:
-            return False
-        cv.coords(self.id, self.x - self.size, self.y - self.size,
-                  self.x + self.size, self.y + self.size)
-        return True
-    
-    def destroy(self):
-        cv.delete(self.id)
-
-def create_explosion(x, y, color_palette):
-    """Create particle explosion effect"""
-    for _ in range(12):  # Reduced from 20 to 12
-        angle = random.uniform(0, 2 * math.pi)
-        speed = random.uniform(2, 8)
-        vx = math.cos(angle) * speed
-        vy = math.sin(angle) * speed
-        color = random.choice(color_palette)
-        size = random.randint(2, 5)
-        lifetime = random.randint(10, 20)  # Reduced from 20-40 to 10-20
-        particles.append(Particle(x, y, vx, vy, color, size, lifetime))
-
-def update_particles():
-    """Update all particles"""
-    global particles
-    particles = [p for p in particles if p.update()]
-    root.after(20, update_particles)
+        """Move each live particle one step and retire expired ones"""
+        xs, ys, vxs, vys = self.x, self.y, self.vx, self.vy
+        ages, lifetimes = self.age, self.lifetime
+        survivors = []
+        for slot in self.live:
+            age = ages[slot] + 1
+            ages[slot] = age
+            if age >= lifetimes[slot]:
+                self.free.append(slot)
+                continue
+            xs[slot] += vxs[slot]
+            ys[slot] += vys[slot]
+            vys[slot] += PARTICLE_GRAVITY
+            survivors.append(slot)
+        self.live = survivors
 
-# ===== Starfield Background =====
-class Star:
+    def clear(self):
+        self.free = list(range(self.capacity - 1, -1, -1))
+        self.live = []
+
+# ===== 共通: 四角どうしの当たり判定 =====
+def check_collision_rect(boxes_a, boxes_b):
+    """Return (i, j) pairs where boxes_a[i] overlaps boxes_b[j]
+
+    Boxes are (left, top, right, bottom) tuples.  A sort-and-sweep along x
+    finds candidate pairs, then the y extents are compared for the exact test.
+    """
+    events = [(box[0], 0, i) for i, box in enumerate(boxes_a)]
+    events += [(box[0], 1, j) for j, box in enumerate(boxes_b)]
+    events.sort()
+    active = ([], [])
+    boxes = (boxes_a, boxes_b)
+    hits = []
+    for left, side, index in events:
+        other = 1 - side
+        # Broadphase: drop boxes that end before this one starts
+        active[other][:] = [k for k in active[other] if boxes[other][k][2] > left]
+        box = boxes[side][index]
+        for k in active[other]:
+            other_box = boxes[other][k]
+            # Narrowphase: x overlap is given by the sweep, check y
+            if box[1] < other_box[3] and other_box[1] < box[3]:
+                hits.append((index, k) if side == 0 else (k, index))
+        active[side].append(index)
+    hits.sort()
+    return hits
+
+# ===== 敵の編隊 =====
+class Formation:
+    """All enemies as one block that marches sideways and drops at the walls
+
+    Member positions are stored as offsets from the formation origin, so a
+    march step only changes the origin.
+    """
     def __init__(self):
-        self.x = random.randint(0, WINDOW_WIDTH)
-        self.y = random.randint(0, WINDOW_HEIGHT)
-        self.speed = random.uniform(0.2, 0.8)  # Slower movement
-        self.size = random.randint(1, 2)  # Smaller stars
-        # More subtle, dimmer colors
-        brightness = random.choice(['#444444', '#555555', '#666666', '#4A5568'])
-        self.id = cv.create_oval(
-            self.x, self.y, self.x + self.size, self.y + self.size,
-            fill=brightness, outline=""
-        )
-    
-    def update(self):
-        self.y += self.speed
-        if self.y > WINDOW_HEIGHT:
-            self.y = 0
-            self.x = random.randint(0, WINDOW_WIDTH)
-        cv.coords(self.id, self.x, self.y, self.x + self.size, self.y + self.size)
-
-def create_starfield():
-    """Create animated starfield background"""
-    for _ in range(15):  # Fewer stars for cleaner look
-        stars.append(Star())
-
-def update_starfield():
-    """Update starfield animation"""
-    for star in stars:
-        star.update()
-    root.after(80, update_starfield)  # Slower update rate
-
-# ===== Screen Shake Effect =====
-def screen_shake(intensity=10, duration=200):
-    """Apply screen shake effect"""
-    global screen_shake_offset
-    start_time = [0]
-    
-    def shake_step():
-        if start_time[0] < duration:
-            screen_shake_offset[0] = random.randint(-intensity, intensity)
-            screen_shake_offset[1] = random.randint(-intensity, intensity)
-            cv.move("all", screen_shake_offset[0], screen_shake_offset[1])
-            start_time[0] += 20
-            root.after(20, shake_step)
+        self.x = 0
+        self.y = 0
+        self.direction = 1
+        self.drop_y = ENEMY_SPACE_Y  # the wave's row spacing
+        self.offset_x = []
+        self.offset_y = []
+        self.alive = []
+        self.color = []
+        self.live_count = 0
+
+    def add(self, x, y, color):
+        self.offset_x.append(x - self.x)
+        self.offset_y.append(y - self.y)
+        self.alive.append(True)
+        self.color.append(color)
+        self.live_count += 1
+        return len(self.alive) - 1
+
+    def __len__(self):
+        return len(self.alive)
+
+    def position(self, index):
+        return (self.x + self.offset_x[index], self.y + self.offset_y[index])
+
+    def live_indexes(self):
+        return [i for i, alive in enumerate(self.alive) if alive]
+
+    def kill(self, index):
+        if self.alive[index]:
+            self.alive[index] = False
+            self.live_count -= 1
+
+    def box(self, index):
+        left, top, right, bottom = ENEMY_HITBOX
+        x, y = self.position(index)
+        return (x + left, y + top, x + right, y + bottom)
+
+    def step(self):
+        """March one step, or drop a row and turn around at a wall"""
+        live = self.live_indexes()
+        if not live:
+            return
+        dx = self.direction * ENEMY_MOVE_SPACE_X
+        if self.direction > 0:
+            edge = self.x + max(self.offset_x[i] for i in live) + dx
+            blocked = edge > WINDOW_WIDTH - ENEMY_MARGIN_X
         else:
-            cv.move("all", -screen_shake_offset[0], -screen_shake_offset[1])
-            screen_shake_offset[0] = 0
-            screen_shake_offset[1] = 0
-    
-    shake_step()
-
-# ===== 自機まわり =====
-def create_cannon(x, y):
-    global cannon_x, cannon_y, cannon_id, cannon_glow_id, cannon_exist
-    cannon_x = x
-    cannon_y = y
-    
-    # Store all spacecraft parts
-    cannon_id = []
-    
-    # Engine glow (bottom thrusters)
-    engine_glow_left = cv.create_oval(
-        cannon_x - 18, cannon_y - 5,
-        cannon_x - 10, cannon_y + 8,
-        fill="#00FFFF", outline="#0088FF", width=2, tags="cannon_engine"
-    )
-    engine_glow_right = cv.create_oval(
-        cannon_x + 10, cannon_y - 5,
-        cannon_x + 18, cannon_y + 8,
-        fill="#00FFFF", outline="#0088FF", width=2, tags="cannon_engine"
-    )
-    
-    # Main fuselage (body)
-    fuselage = cv.create_polygon(
-        cannon_x, cannon_y - 25,      # nose
-        cannon_x + 12, cannon_y - 10,  # right side
-        cannon_x + 10, cannon_y + 5,   # right bottom
-        cannon_x - 10, cannon_y + 5,   # left bottom
-        cannon_x - 12, cannon_y - 10,  # left side
-        fill="#2E86AB", outline="#1A5F7A", width=2, tags="cannon_body", smooth=True
-    )
-    
-    # Wings
-    left_wing = cv.create_polygon(
-        cannon_x - 12, cannon_y - 8,
-        cannon_x - 25, cannon_y,
-        cannon_x - 20, cannon_y + 3,
-        cannon_x - 10, cannon_y - 5,
-        fill="#1A5F7A", outline="#0D3B52", width=2, tags="cannon_wing"
-    )
-    right_wing = cv.create_polygon(
-        cannon_x + 12, cannon_y - 8,
-        cannon_x + 25, cannon_y,
-        cannon_x + 20, cannon_y + 3,
-        cannon_x + 10, cannon_y - 5,
-        fill="#1A5F7A", outline="#0D3B52", width=2, tags="cannon_wing"
-    )
-    
-    # Cockpit window
-    cockpit = cv.create_oval(
-        cannon_x - 5, cannon_y - 18,
-        cannon_x + 5, cannon_y - 8,
-        fill="#00FFFF", outline="#FFFFFF", width=1, tags="cannon_cockpit"
-    )
-    
-    # Weapon barrels
-    left_barrel = cv.create_rectangle(
-        cannon_x - 15, cannon_y - 15,
-        cannon_x - 13, cannon_y - 5,
-        fill="#FF6B35", outline="#C44900", width=1, tags="cannon_weapon"
-    )
-    right_barrel = cv.create_rectangle(
-        cannon_x + 13, cannon_y - 15,
-        cannon_x + 15, cannon_y - 5,
-        fill="#FF6B35", outline="#C44900", width=1, tags="cannon_weapon"
-    )
-    
-    # Outer glow aura
-    cannon_glow_id = cv.create_oval(
-        cannon_x - 30, cannon_y - 30,
-        cannon_x + 30, cannon_y + 30,
-        fill="", outline="cyan", width=2, tags="cannon_glow"
-    )
-    
-    # Store all IDs
-    cannon_id = {
-        "fuselage": fuselage,
-        "left_wing": left_wing,
-        "right_wing": right_wing,
-        "cockpit": cockpit,
-        "left_barrel": left_barrel,
-        "right_barrel": right_barrel,
-        "engine_left": engine_glow_left,
-        "engine_right": engine_glow_right,
-        "glow": cannon_glow_id
-    }
-    
-    cannon_exist = True
-    cv.tag_bind("cannon_body", "<ButtonPress-3>", cannon_pressed)
-    cv.tag_bind("cannon_body", "<Button1-Motion>", cannon_dragged)
-    cv.tag_bind("cannon_wing", "<Button1-Motion>", cannon_dragged)
-    cv.tag_bind("cannon_cockpit", "<Button1-Motion>", cannon_dragged)
-    animate_cannon_glow()
-    animate_engine_thrust()
-
-def animate_engine_thrust():
-    """Animate the engine thrust glow"""
-    if not cannon_exist or not cannon_id:
-        return
-    
-    # Pulsing engine effect
-    phase = random.uniform(0, 0.5)
-    colors = ["#00FFFF", "#00DDFF", "#00BBFF", "#0099FF"]
-    
-    if "engine_left" in cannon_id and "engine_right" in cannon_id:
-        cv.itemconfig(cannon_id["engine_left"], fill=random.choice(colors))
-        cv.itemconfig(cannon_id["engine_right"], fill=random.choice(colors))
-    
-    root.after(100, animate_engine_thrust)
-
-def animate_cannon_glow():
-    """Animate the glowing effect around cannon"""
-    global glow_phase
-    if not cannon_exist or not cannon_id or "glow" not in cannon_id:
-        return
-    glow_phase += 0.1
-    size = 30 + math.sin(glow_phase) * 5
-    cv.coords(cannon_id["glow"],
-              cannon_x - size, cannon_y - size,
-              cannon_x + size, cannon_y + size)
-    root.after(50, animate_cannon_glow)
-
-def cannon_pressed(event):
-    if not cannon_exist:
-        return
-    create_my_bullet(event.x, CANNON_Y)
-    create_muzzle_flash(event.x, CANNON_Y)
-
-def create_muzzle_flash(x, y):
-    """Create muzzle flash effect when shooting"""
-    flash_id = cv.create_oval(
-        x - 15, y - 15, x + 15, y + 15,
-        fill="yellow", outline="orange", width=2
-    )
-    root.after(50, lambda: cv.delete(flash_id))
-
-def cannon_dragged(event):
-    global cannon_x
-    if not cannon_exist or not cannon_id:
-        return
-    
-    # Calculate movement delta
-    old_x = cannon_x
-    cannon_x = event.x
-    dx = cannon_x - old_x
-    
-    # Move all spacecraft parts
-    cv.move("cannon_body", dx, 0)
-    cv.move("cannon_wing", dx, 0)
-    cv.move("cannon_cockpit", dx, 0)
-    cv.move("cannon_weapon", dx, 0)
-    cv.move("cannon_engine", dx, 0)
-    cv.move("cannon_glow", dx, 0)
-
-def destroy_cannon():
-    global cannon_id
-    if cannon_id:
-        # Delete all spacecraft parts
-        for part_id in cannon_id.values():
-            if part_id:
-                cv.delete(part_id)
-        cannon_id = None
-
-# ===== キーボード操作の追加 =====
-def move_cannon(dx):
-    global cannon_x
-    if not cannon_exist or not cannon_id:
-        return
-    cannon_x += dx
-    cannon_x = max(30, min(WINDOW_WIDTH - 30, cannon_x))
-    
-    # Move all spacecraft parts
-    cv.move("cannon_body", dx, 0)
-    cv.move("cannon_wing", dx, 0)
-    cv.move("cannon_cockpit", dx, 0)
-    cv.move("cannon_weapon", dx, 0)
-    cv.move("cannon_engine", dx, 0)
-    cv.move("cannon_glow", dx, 0)
-
-def on_key_press(event):
-    if event.keysym == "Left":
-        move_cannon(-15)
-    elif event.keysym == "Right":
-        move_cannon(15)
-    elif event.keysym == "space":
-        if cannon_exist:
-            create_my_bullet(cannon_x, CANNON_Y)
-            create_muzzle_flash(cannon_x, CANNON_Y)
-
-# ===== 自分の弾まわり =====
-def create_my_bullet(x, y):
-    bullet_id = cv.create_rectangle(
-        x - BULLET_WIDTH, y + BULLET_HEIGHT,
-        x + BULLET_WIDTH, y - BULLET_HEIGHT,
-        fill="cyan", outline="white", width=1
-    )
-    # Create bullet glow
-    glow_id = cv.create_oval(
-        x - 8, y - 8, x + 8, y + 8,
-        fill="", outline="cyan", width=2
-    )
-    bullet = {
-        "x": x,
-        "y": y,
-        "id": bullet_id,
-        "glow_id": glow_id,
-        "alive": True,
-        "trail": []
+            edge = self.x + min(self.offset_x[i] for i in live) + dx
+            blocked = edge < ENEMY_MARGIN_X
+        if blocked:
+            self.direction = -self.direction
+            self.y += self.drop_y
+        else:
+            self.x += dx
+
+# ===== ウェーブ =====
+def grid_layout(count, columns):
+    """Layout rows for count enemies in rows of columns, coloured in turn"""
+    rows = []
+    for start in range(0, count, columns):
+        rows.append("".join(str((start + i) % len(ENEMY_COLORS) + 1)
+                            for i in range(min(columns, count - start))))
+    return rows
+
+DEFAULT_WAVE = {
+    "layout": grid_layout(NUMBER_OF_ENEMY, ENEMY_COLUMNS),
+    "space_x": ENEMY_SPACE_X, "space_y": ENEMY_SPACE_Y,
+    "move_ms": ENEMY_MOVE_SPEED, "shoot_ms": ENEMY_SHOOT_INTERVAL, "volley": 1,
+}
+
+def load_waves(path=WAVES_FILE):
+    """Read wave definitions; falls back to the classic single wave"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"waves": [DEFAULT_WAVE], "endless": None}
+    return {"waves": data.get("waves") or [DEFAULT_WAVE], "endless": data.get("endless")}
+
+def endless_wave(config, n):
+    """The n-th generated wave (0 based): more rows, columns, speed and fire"""
+    rows = min(config["max_rows"], config["rows"] + n * config["rows_per_wave"])
+    columns = min(config["max_columns"], config["columns"] + n * config["columns_per_wave"])
+    return {
+        "layout": grid_layout(rows * columns, columns),
+        "space_x": config["space_x"], "space_y": config["space_y"],
+        "move_ms": max(config["min_move_ms"], config["move_ms"] * config["move_ramp"] ** n),
+        "shoot_ms": max(config["min_shoot_ms"], config["shoot_ms"] * config["shoot_ramp"] ** n),
+        "volley": min(config["max_volley"], config["volley"] + n * config["volley_per_wave"]),
     }
-    my_bullets.append(bullet)
-    index = len(my_bullets) - 1
-    shoot_my_bullet(index)
 
-def shoot_my_bullet(index):
-    bullet = my_bullets[index]
-    if not bullet["alive"]:
-        return
-    if bullet["y"] >= 0:
-        # Create trail particle - reduced frequency
-        if random.random() < 0.2:  # Reduced from 0.5 to 0.2
-            particles.append(Particle(
-                bullet["x"], bullet["y"], 
-                random.uniform(-0.5, 0.5), random.uniform(0, 1),
-                "cyan", 2, 15
-            ))
-        
-        cv.move(bullet["id"], 0, -BULLET_HEIGHT)
-        cv.move(bullet["glow_id"], 0, -BULLET_HEIGHT)
-        bullet["y"] -= BULLET_HEIGHT
-        defeat_enemy_with_bullet(index)
-        root.after(BULLET_SPEED, lambda i=index: shoot_my_bullet(i))
-    else:
-        destroy_my_bullet(index)
-
-def defeat_enemy_with_bullet(index):
-    bullet = my_bullets[index]
-    if not bullet["alive"]:
-        return
-    bullet_coords = cv.coords(bullet["id"])
-    for enemy in enemies:
-        if enemy["exist"]:
-            enemy_coords = cv.coords(enemy["id"])
-            if check_collision_rect(bullet_coords, enemy_coords):
-                enemy["exist"] = False
-                # Create explosion effect
-                create_explosion(enemy["x"], enemy["y"], 
-                               ["yellow", "orange", "red", "white"])
-                # Create expanding ring effect
-                create_ring_effect(enemy["x"], enemy["y"])
-                
-                # Delete all UFO parts
-                if "parts" in enemy:
-                    for part_id in enemy["parts"].values():
-                        if part_id:
-                            cv.delete(part_id)
-                cv.delete(enemy["id"])
-                
-                # Animated text
-                text_id = cv.create_text(
-                    enemy["x"], enemy["y"],
-                    text="BOOM!", fill="yellow",
-                    font=("System", TEXT_GOOD_SIZE * 2, "bold"),
-                    tag="good"
+# ===== シミュレーション本体 (tkinter 非依存) =====
+class Inputs:
+    """Player input for one tick: a snapshot, however many device events made it"""
+    def __init__(self):
+        self.move_x = 0  # held arrow keys: -1, 0 or 1
+        self.pointer_x = None  # latest absolute cannon x from a mouse drag
+        self.fire_x = []  # x of each new fire press; None fires from the cannon
+        self.fire_held = False  # keep firing at FIRE_INTERVAL
+
+class InvaderSim:
+    """Game state and rules with no dependency on tkinter
+
+    Advance it with step(inputs).  Things a renderer may want to show once
+    (explosions, shots, game over) are appended to self.events as tuples;
+    the consumer clears the list.
+    """
+    def __init__(self, seed=None, waves=None, endless=False):
+        self.waves = waves or {"waves": [DEFAULT_WAVE], "endless": None}
+        self.endless = endless and self.waves["endless"] is not None
+        self.invulnerable = False  # load tests keep the cannon alive
+        self.quality = QUALITY_TIERS[0]  # effect detail, see QualityGovernor
+        self.scheduler = TickScheduler()
+        self.my_bullets = BulletPool(MY_BULLET_CAPACITY)
+        self.enemy_bullets = BulletPool(ENEMY_BULLET_CAPACITY)
+        self.particles = ParticleEngine()
+        self.formation = Formation()
+        self.events = []
+        self.register_systems()
+        self.reset(seed)
+
+    def register_systems(self):
+        scheduler = self.scheduler
+        scheduler.register_system("my_bullets", self.update_my_bullets, BULLET_STEP)
+        scheduler.register_system("enemy_bullets", self.update_enemy_bullets, BULLET_STEP)
+        scheduler.register_system("bullet_hits", self.defeat_enemy_with_bullet, BULLET_STEP)
+        scheduler.register_system("cannon_hits", self.collision_enemy_bullet, BULLET_STEP)
+        scheduler.register_system("particles", self.particles.update, 20)
+        # "enemies" and "enemy_shoot" are per-round: start_wave() registers them
+
+    def reset(self, seed=None):
+        """Reset the game to initial state
+
+        Every random choice in the simulation comes from self.rng, so the
+        same seed and the same inputs give the same game. Particles draw
+        from effects_rng instead, so the quality tier never changes the game.
+        """
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.effects_rng = random.Random(f"{seed}-effects")
+        self.scheduler.tick_count = 0
+        self.cannon_x = WINDOW_WIDTH // 2
+        self.cannon_y = CANNON_Y
+        self.cannon_exist = True
+        self.fire_queue = deque(maxlen=MAX_QUEUED_SHOTS)
+        self.fire_cooldown = 0  # ticks until the gun can fire again
+        self.score = 0
+        self.game_over = False
+        self.game_clear = False
+        self.my_bullets.clear()
+        self.enemy_bullets.clear()
+        self.particles.clear()
+        self.events.clear()
+        self.scheduler.unregister_scope("game")
+        self.start_wave(1)
+
+    @property
+    def tick(self):
+        """Ticks since the last reset"""
+        return self.scheduler.tick_count
+
+    def state_digest(self):
+        """Short summary of the game state, compared when verifying replays"""
+        formation = self.formation
+        return (f"t{self.tick} w{self.wave} s{self.score} c{self.cannon_x} "
+                f"f{formation.x},{formation.y},{formation.live_count} "
+                f"o{int(self.game_over)}{int(self.game_clear)}")
+
+    def step(self, inputs=None):
+        """Apply one tick of input and advance every system by one tick"""
+        self.apply_inputs(inputs or Inputs())
+        self.scheduler.step()
+
+    def apply_inputs(self, inputs):
+        """Move the cannon at most once and fire at most one shot per tick"""
+        if not self.cannon_exist:
+            return
+        x = self.cannon_x
+        if inputs.pointer_x is not None:
+            x = inputs.pointer_x
+        x += inputs.move_x * CANNON_SPEED
+        self.cannon_x = max(30, min(WINDOW_WIDTH - 30, x))
+        self.fire_queue.extend(inputs.fire_x)
+        if self.fire_cooldown > 0:
+            self.fire_cooldown -= 1
+            return
+        if self.fire_queue:
+            x = self.fire_queue.popleft()
+        elif inputs.fire_held:
+            x = None
+        else:
+            return
+        if x is None:
+            x = self.cannon_x
+        self.fire_cooldown = max(1, round(FIRE_INTERVAL / self.scheduler.tick_ms)) - 1
+        self.create_my_bullet(x, CANNON_Y)
+        self.events.append(("shot", x, CANNON_Y))
+
+    def create_explosion(self, x, y, color_palette):
+        """Create particle explosion effect"""
+        rng = self.effects_rng
+        for _ in range(self.quality["explosion"]):
+            angle = rng.uniform(0, 2 * math.pi)
+            speed = rng.uniform(2, 8)
+            vx = math.cos(angle) * speed
+            vy = math.sin(angle) * speed
+            color = rng.choice(color_palette)
+            size = rng.randint(2, 5)
+            lifetime = rng.randint(10, 20)
+            self.particles.emit(x, y, vx, vy, color, size, lifetime)
+
+    # ----- 自分の弾 -----
+    def create_my_bullet(self, x, y):
+        handle = self.my_bullets.spawn(x, y)
+        if handle is not None:
+            self.shoot_my_bullet(handle)
+        return handle
+
+    def update_my_bullets(self):
+        """Step every live player bullet"""
+        for handle in self.my_bullets.handles():
+            self.shoot_my_bullet(handle)
+
+    def shoot_my_bullet(self, handle):
+        bullets = self.my_bullets
+        slot = bullets.get(handle)
+        if slot is None:
+            return
+        if bullets.y[slot] >= 0:
+            rng = self.effects_rng
+            if rng.random() < self.quality["my_trail"]:
+                self.particles.emit(
+                    bullets.x[slot], bullets.y[slot],
+                    rng.uniform(-0.5, 0.5), rng.uniform(0, 1),
+                    "cyan", 2, 15
                 )
-                animate_text_fade(text_id, enemy["y"])
-                destroy_my_bullet(index)
-                break
-
-def create_ring_effect(x, y):
-    """Create expanding ring effect"""
-    ring_id = cv.create_oval(x-5, y-5, x+5, y+5, 
-                             outline="yellow", width=3, fill="")
-    
-    def expand_ring(size, alpha):
-        if size < 50 and alpha > 0:
-            cv.coords(ring_id, x-size, y-size, x+size, y+size)
-            root.after(20, lambda: expand_ring(size+3, alpha-0.1))
+            bullets.move(slot, -BULLET_VELOCITY * BULLET_STEP)
         else:
-            cv.delete(ring_id)
-    
-    expand_ring(5, 1.0)
-
-def animate_text_fade(text_id, start_y):
-    """Animate text floating up and fading"""
-    def fade_step(y, steps):
-        if steps > 0:
-            cv.move(text_id, 0, -2)
-            root.after(30, lambda: fade_step(y-2, steps-1))
+            bullets.release(handle)
+
+    def defeat_enemy_with_bullet(self):
+        """Test every player bullet's last move against the live enemies in one pass
+
+        A bullet whose path crosses several enemies hits the lowest one, the
+        first it would have reached.
+        """
+        handles = self.my_bullets.handles()
+        formation = self.formation
+        live = formation.live_indexes()
+        if not handles or not live:
+            return
+        bullet_boxes = [self.my_bullets.swept_box(slot) for slot, _ in handles]
+        enemy_boxes = [formation.box(index) for index in live]
+        crossed = {}
+        for i, j in check_collision_rect(bullet_boxes, enemy_boxes):
+            crossed.setdefault(i, []).append(j)
+        for i, candidates in sorted(crossed.items()):
+            candidates = [j for j in candidates if formation.alive[live[j]]]
+            if not candidates:
+                continue
+            index = live[max(candidates, key=lambda j: (enemy_boxes[j][3], -j))]
+            formation.kill(index)
+            self.score += ENEMY_SCORE
+            x, y = formation.position(index)
+            # Create explosion effect
+            self.create_explosion(x, y, ["yellow", "orange", "red", "white"])
+            self.events.append(("enemy_destroyed", x, y, index))
+            self.my_bullets.release(handles[i])
+        self.gameclear()
+
+    # ----- ウェーブ -----
+    def wave_config(self, number):
+        """Settings for wave number (1 based), or None after the last wave"""
+        waves = self.waves["waves"]
+        if number <= len(waves):
+            return waves[number - 1]
+        if self.endless:
+            return endless_wave(self.waves["endless"], number - len(waves) - 1)
+        return None
+
+    def start_wave(self, number):
+        config = self.wave_config(number)
+        if config is None:
+            raise ValueError(f"there is no wave {number}")
+        self.wave = number
+        self.volley = config.get("volley", 1)
+        self.create_enemies(config["layout"], config.get("space_x", ENEMY_SPACE_X),
+                            config.get("space_y", ENEMY_SPACE_Y))
+        self.scheduler.register_system("enemies", self.formation_step,
+                                       config.get("move_ms", ENEMY_MOVE_SPEED), scope="game")
+        self.scheduler.register_system("enemy_shoot", self.enemy_random_shoot,
+                                       config.get("shoot_ms", ENEMY_SHOOT_INTERVAL),
+                                       scope="game")
+        self.events.append(("wave_start", number, self.formation.live_count))
+
+    # ----- 敵 -----
+    def create_enemies(self, layout, space_x=ENEMY_SPACE_X, space_y=ENEMY_SPACE_Y):
+        """Build the formation from layout rows, centred horizontally"""
+        self.formation = Formation()
+        self.formation.drop_y = space_y
+        width = max(len(row) for row in layout)
+        left = (WINDOW_WIDTH - (width - 1) * space_x) / 2
+        for row_index, row in enumerate(layout):
+            for column, cell in enumerate(row):
+                if cell.isdigit():
+                    color = ENEMY_COLORS[(int(cell) - 1) % len(ENEMY_COLORS)]
+                    self.formation.add(left + column * space_x,
+                                       (row_index + 1) * space_y, color)
+
+    def formation_step(self):
+        formation = self.formation
+        formation.step()
+        # The invasion is over once the formation reaches the cannon
+        live = formation.live_indexes()
+        if self.cannon_exist and live:
+            bottom = max(formation.box(index)[3] for index in live)
+            if bottom < self.cannon_y + CANNON_HITBOX[1]:
+                return
+            if not self.invulnerable:
+                self.gameover()
+            else:
+                # Load tests wrap the formation back to the top to keep the wave going
+                formation.y = 0
+
+    def enemy_random_shoot(self):
+        live = self.formation.live_indexes()
+        if live:
+            for index in self.rng.sample(live, min(self.volley, len(live))):
+                x, y = self.formation.position(index)
+                self.create_enemy_bullet(x, y)
+
+    # ----- 敵の弾 -----
+    def create_enemy_bullet(self, x, y):
+        handle = self.enemy_bullets.spawn(x, y)
+        if handle is not None:
+            self.shoot_enemy_bullet(handle)
+        return handle
+
+    def update_enemy_bullets(self):
+        """Step every live enemy bullet"""
+        for handle in self.enemy_bullets.handles():
+            self.shoot_enemy_bullet(handle)
+
+    def shoot_enemy_bullet(self, handle):
+        bullets = self.enemy_bullets
+        slot = bullets.get(handle)
+        if slot is None:
+            return
+        if bullets.y[slot] <= WINDOW_HEIGHT:
+            rng = self.effects_rng
+            if rng.random() < self.quality["enemy_trail"]:
+                self.particles.emit(
+                    bullets.x[slot], bullets.y[slot],
+                    rng.uniform(-0.5, 0.5), rng.uniform(-1, 0),
+                    "red", 2, 15
+                )
+            bullets.move(slot, BULLET_VELOCITY * BULLET_STEP)
         else:
-            cv.delete(text_id)
-    fade_step(start_y, 20)
-
-def destroy_my_bullet(index):
-    bullet = my_bullets[index]
-    if bullet["alive"]:
-        bullet["alive"] = False
-        cv.delete(bullet["id"])
-        if "glow_id" in bullet:
-            cv.delete(bullet["glow_id"])
-
-# ===== 敵まわり =====
-def create_enemies():
-    colors = ["#FF6B6B", "#FFA500", "#FFD700", "#FF1493", "#FF4500"]
-    for i in range(NUMBER_OF_ENEMY):
-        x = i * ENEMY_SPACE_X + 50
-        y = ENEMY_SPACE_Y
-        color = colors[i % len(colors)]
-        enemy = {
-            "x": x % WINDOW_WIDTH,
-            "y": y + x // WINDOW_WIDTH * ENEMY_SPACE_Y,
-            "parts": {},  # Store all UFO parts
-            "exist": True,
-            "color": color,
-            "pulse_phase": random.uniform(0, 2 * math.pi),
-            "beam_phase": random.uniform(0, 2 * math.pi)
-        }
-        
-        # Create UFO flying saucer
-        create_ufo(enemy)
-        enemies.append(enemy)
-    
-    for idx in range(len(enemies)):
-        move_enemy(idx)
-    pulse_enemies()
-    animate_ufo_beams()
-
-def create_ufo(enemy):
-    """Create a detailed UFO flying saucer"""
-    x = enemy["x"]
-    y = enemy["y"]
-    color = enemy["color"]
-    
-    # Light beam underneath (animated)
-    beam = cv.create_polygon(
-        x - 3, y + 15,
-        x + 3, y + 15,
-        x + 8, y + 30,
-        x - 8, y + 30,
-        fill="#FFFF00", outline="", stipple="gray25", tags="enemy_beam"
-    )
-    
-    # Outer glow
-    glow = cv.create_oval(
-        x - 22, y - 22,
-        x + 22, y + 22,
-        fill="", outline=color, width=2, tags="enemy_glow"
-    )
-    
-    # Saucer bottom (darker shade)
-    bottom_color = darken_color(color)
-    saucer_bottom = cv.create_oval(
-        x - 18, y + 5,
-        x + 18, y + 15,
-        fill=bottom_color, outline=darken_color(bottom_color), width=1, tags="enemy_body"
-    )
-    
-    # Main saucer body
-    saucer = cv.create_oval(
-        x - 20, y - 5,
-        x + 20, y + 10,
-        fill=color, outline="white", width=2, tags="enemy_body"
-    )
-    
-    # Dome top
-    dome = cv.create_oval(
-        x - 10, y - 15,
-        x + 10, y + 5,
-        fill=lighten_color(color), outline="white", width=1, tags="enemy_body"
-    )
-    
-    # Cockpit window (glowing)
-    window = cv.create_oval(
-        x - 5, y - 10,
-        x + 5, y,
-        fill="#00FFFF", outline="#FFFFFF", width=1, tags="enemy_window"
-    )
-    
-    # Small lights on saucer edge
-    light1 = cv.create_oval(
-        x - 15, y + 2,
-        x - 12, y + 5,
-        fill="#00FF00", outline="", tags="enemy_lights"
-    )
-    light2 = cv.create_oval(
-        x + 12, y + 2,
-        x + 15, y + 5,
-        fill="#FF0000", outline="", tags="enemy_lights"
-    )
-    light3 = cv.create_oval(
-        x - 2, y + 8,
-        x + 2, y + 11,
-        fill="#0000FF", outline="", tags="enemy_lights"
-    )
-    
-    # Store all parts
-    enemy["parts"] = {
-        "beam": beam,
-        "glow": glow,
-        "saucer_bottom": saucer_bottom,
-        "saucer": saucer,
-        "dome": dome,
-        "window": window,
-        "light1": light1,
-        "light2": light2,
-        "light3": light3
-    }
-    
-    # Store main ID for collision
-    enemy["id"] = saucer
+            bullets.release(handle)
+
+    def collision_enemy_bullet(self):
+        """Test every enemy bullet against the cannon in one batched pass"""
+        if not self.cannon_exist or self.invulnerable:
+            return
+        handles = self.enemy_bullets.handles()
+        if not handles:
+            return
+        left, top, right, bottom = CANNON_HITBOX
+        cannon_box = (self.cannon_x + left, self.cannon_y + top,
+                      self.cannon_x + right, self.cannon_y + bottom)
+        bullet_boxes = [self.enemy_bullets.swept_box(slot) for slot, _ in handles]
+        if check_collision_rect(bullet_boxes, [cannon_box]):
+            # Create explosion at cannon position
+            self.create_explosion(self.cannon_x, self.cannon_y,
+                                  ["red", "orange", "yellow", "white"])
+            self.gameover()
+
+    # ----- GAME CLEAR / GAME OVER -----
+    def gameover(self):
+        self.cannon_exist = False
+        self.game_over = True
+        self.events.append(("game_over", self.cannon_x, self.cannon_y))
+
+    def gameclear(self):
+        if self.game_clear or self.formation.live_count:
+            return
+        if self.wave_config(self.wave + 1) is not None:
+            self.start_wave(self.wave + 1)
+            return
+        self.game_clear = True
+        self.events.append(("game_clear",))
+
+def autopilot(sim):
+    """Inputs that park the cannon under the lowest enemy and keep firing"""
+    inputs = Inputs()
+    formation = sim.formation
+    live = formation.live_indexes()
+    if live:
+        target = max(live, key=lambda index: (formation.offset_y[index], -index))
+        inputs.pointer_x = formation.position(target)[0]
+    inputs.fire_held = True
+    return inputs
+
+def run_endless(ticks, seed=None, waves=None):
+    """Endless-mode load test; logs wave number, enemy count and tick time per wave
+
+    A wave that is not cleared moves on after ENDLESS_WAVE_TICKS, so each
+    line covers the steady state of one formation size.
+    """
+    sim = InvaderSim(seed, waves or load_waves(), endless=True)
+    sim.invulnerable = True
+    wave_ticks = []
+
+    def report():
+        if wave_ticks:
+            ordered = sorted(wave_ticks)
+            p50 = ordered[len(ordered) // 2]
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            over = sum(1 for ms in ordered if ms > TICK_MS)
+            print(f"wave {wave:3d} enemies {count:4d} ticks {len(ordered):6d} "
+                  f"tick p50 {p50:6.3f} p95 {p95:6.3f} max {ordered[-1]:6.3f} ms "
+                  f"over budget {over}")
+
+    wave, count = sim.wave, sim.formation.live_count
+    for _ in range(ticks):
+        start = time.perf_counter()
+        sim.step(autopilot(sim))
+        wave_ticks.append((time.perf_counter() - start) * 1000)
+        sim.events.clear()
+        if (len(wave_ticks) >= ENDLESS_WAVE_TICKS
+                and sim.wave_config(sim.wave + 1) is not None):
+            sim.start_wave(sim.wave + 1)
+        if sim.wave != wave:
+            report()
+            wave, count = sim.wave, sim.formation.live_count
+            wave_ticks = []
+    report()
+    return sim
+
+def run_headless(ticks, profiler=None, seed=None):
+    """Run the simulation without a display; returns ticks per second
+
+    With a profiler every tick is recorded as one frame.
+    """
+    sim = InvaderSim(seed)
+    sim.scheduler.profiler = profiler
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tick_start = time.perf_counter()
+        sim.step()
+        sim.events.clear()
+        if profiler is not None:
+            profiler.end_frame((time.perf_counter() - tick_start) * 1000, 1)
+    elapsed = time.perf_counter() - start
+    return ticks / elapsed if elapsed > 0 else float("inf")
+
+# ===== 記録と再生 =====
+class InputRecorder:
+    """Captures the inputs of every tick since a reset so the game can be replayed"""
+    def __init__(self, seed):
+        self.seed = seed
+        self.ticks = 0
+        # [tick, move_x, pointer_x, fire_x, fire_held] for non-empty ticks
+        self.inputs = []
+
+    def record(self, inputs):
+        if (inputs.move_x or inputs.pointer_x is not None or inputs.fire_x
+                or inputs.fire_held):
+            self.inputs.append([self.ticks, inputs.move_x, inputs.pointer_x,
+                                list(inputs.fire_x), inputs.fire_held])
+        self.ticks += 1
+
+    def save(self, path, sim):
+        with open(path, "w") as f:
+            json.dump({
+                "version": REPLAY_VERSION,
+                "seed": self.seed,
+                "endless": sim.endless,
+                "ticks": self.ticks,
+                "digest": sim.state_digest(),
+                "inputs": self.inputs,
+            }, f)
+
+class ReplayPlayer:
+    """Feeds recorded inputs back into a simulation, tick by tick"""
+    def __init__(self, data):
+        if data.get("version") != REPLAY_VERSION:
+            raise ValueError(f"unsupported replay version {data.get('version')}")
+        self.seed = data["seed"]
+        self.endless = data.get("endless", False)
+        self.ticks = data["ticks"]
+        self.digest = data.get("digest")
+        self.by_tick = {entry[0]: entry for entry in data["inputs"]}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def inputs_for(self, tick):
+        inputs = Inputs()
+        entry = self.by_tick.get(tick)
+        if entry is not None:
+            inputs.move_x = entry[1]
+            inputs.pointer_x = entry[2]
+            inputs.fire_x = list(entry[3])
+            inputs.fire_held = entry[4]
+        return inputs
+
+    def run_headless(self, waves=None):
+        """Replay without a display; returns (simulation, digest matches)"""
+        sim = InvaderSim(self.seed, waves or load_waves(), self.endless)
+        for tick in range(self.ticks):
+            sim.step(self.inputs_for(tick))
+            sim.events.clear()
+        return sim, self.digest is None or sim.state_digest() == self.digest
+
+# ===== ベンチマーク =====
+def top_up_bullets(sim, pool, target):
+    """Spawn bullets at random spots until target are alive"""
+    while pool.capacity - len(pool.free) < target:
+        pool.spawn(sim.rng.uniform(0, WINDOW_WIDTH), sim.rng.uniform(0, WINDOW_HEIGHT))
+
+def bench_enemies(sim):
+    sim.create_enemies(grid_layout(100, 20), space_x=25)
+
+def bench_bullets(sim):
+    sim.my_bullets = BulletPool(128)
+    sim.enemy_bullets = BulletPool(128)
+    def hook():
+        top_up_bullets(sim, sim.my_bullets, 100)
+        top_up_bullets(sim, sim.enemy_bullets, 100)
+    return hook
+
+def bench_explosions(sim):
+    def hook():
+        sim.create_explosion(sim.effects_rng.uniform(0, WINDOW_WIDTH),
+                             sim.effects_rng.uniform(0, WINDOW_HEIGHT),
+                             ["yellow", "orange", "red", "white"])
+    return hook
+
+def bench_stress(sim):
+    bench_enemies(sim)
+    hooks = [bench_bullets(sim), bench_explosions(sim)]
+    def hook():
+        if not sim.formation.live_count:
+            bench_enemies(sim)
+        for h in hooks:
+            h()
+    return hook
+
+BENCH_SCENARIOS = {
+    "default": lambda sim: None,
+    "enemies100": bench_enemies,
+    "bullets200": bench_bullets,
+    "explosions": bench_explosions,
+    "stress": bench_stress,
+}
+
+def run_scenario(setup, ticks, seed):
+    sim = InvaderSim(seed)
+    sim.invulnerable = True  # the run never ends early
+    hook = setup(sim)
+    for _ in range(ticks):
+        if hook is not None:
+            hook()
+        sim.step()
+        sim.events.clear()
+    return sim
+
+def run_benchmark(names, ticks=BENCH_TICKS, seed=BENCH_SEED):
+    """Time each scenario, then re-run it under tracemalloc for peak memory"""
+    print(f"{'scenario':<12}{'ticks/s':>10}{'peak KiB':>10}  digest")
+    for name in names:
+        setup = BENCH_SCENARIOS[name]
+        start = time.perf_counter()
+        sim = run_scenario(setup, ticks, seed)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        run_scenario(setup, ticks, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<12}{ticks / elapsed:>10.0f}{peak / 1024:>10.0f}  {sim.state_digest()}")
 
 def lighten_color(hex_color):
     """Lighten a hex color"""
@@ -564,237 +1096,931 @@ def darken_color(hex_color):
     b = max(0, int(hex_color[5:7], 16) - 40)
     return f"#{r:02X}{g:02X}{b:02X}"
 
-def animate_ufo_beams():
-    """Animate the UFO light beams"""
-    for enemy in enemies:
-        if enemy["exist"] and "beam" in enemy["parts"]:
-            enemy["beam_phase"] += 0.15
-            # Pulsing opacity effect by changing stipple
-            if math.sin(enemy["beam_phase"]) > 0:
-                cv.itemconfig(enemy["parts"]["beam"], stipple="gray25")
-            else:
-                cv.itemconfig(enemy["parts"]["beam"], stipple="gray50")
-    root.after(100, animate_ufo_beams)
+# ===== スプライト (ラスタライズ済み画像) =====
+# Sprites are painted into flat lists of "#RRGGBB" strings (None is
+# transparent) once, then turned into PhotoImages.  Offsets are relative to
+# the entity centre, like the canvas primitives they replace.
+def stipple_pattern(name):
+    if name == "gray50":
+        return lambda px, py: (px + py) % 2 == 0
+    if name == "gray25":
+        return lambda px, py: (px + 2 * (py % 2)) % 4 == 0
+    return None
 
-def move_enemy(index):
-    enemy = enemies[index]
-    if not enemy["exist"]:
-        return
-    
-    old_x = enemy["x"]
-    old_y = enemy["y"]
-    
-    x = enemy["x"]
-    y = enemy["y"]
-    if x > WINDOW_WIDTH:
-        x -= ENEMY_MOVE_SPACE_X
-        y += ENEMY_SPACE_Y
-    elif x < 0:
-        x += ENEMY_MOVE_SPACE_X
-        y += ENEMY_SPACE_Y
-    if y % (ENEMY_SPACE_Y * 2) == ENEMY_SPACE_Y:
-        x += ENEMY_MOVE_SPACE_X
-    else:
-        x -= ENEMY_MOVE_SPACE_X
-    
-    dx = x - old_x
-    dy = y - old_y
-    
-    enemy["x"] = x
-    enemy["y"] = y
-    
-    # Move all UFO parts together
-    if "parts" in enemy:
-        for part_id in enemy["parts"].values():
-            if part_id:
-                cv.move(part_id, dx, dy)
-    
-    root.after(ENEMY_MOVE_SPEED, lambda i=index: move_enemy(i))
-
-def pulse_enemies():
-    """Animate pulsing effect for enemies"""
-    for enemy in enemies:
-        if enemy["exist"] and "parts" in enemy and "glow" in enemy["parts"]:
-            enemy["pulse_phase"] += 0.1
-            size_offset = math.sin(enemy["pulse_phase"]) * 3
-            cv.coords(
-                enemy["parts"]["glow"],
-                enemy["x"] - 22 - size_offset, enemy["y"] - 22 - size_offset,
-                enemy["x"] + 22 + size_offset, enemy["y"] + 22 + size_offset
+def paint_oval(layer, size, origin, box, fill=None, outline=None, width=1,
+               stipple=None):
+    w, h = size
+    ox, oy = origin
+    x0, y0, x1, y1 = box
+    cx = (x0 + x1) / 2
+    cy = (y0 + y1) / 2
+    half = width / 2 if outline else 0
+    rx_out, ry_out = (x1 - x0) / 2 + half, (y1 - y0) / 2 + half
+    rx_in, ry_in = max(0.1, rx_out - 2 * half), max(0.1, ry_out - 2 * half)
+    pattern = stipple_pattern(stipple)
+    for py in range(max(0, int(cy + oy - ry_out)), min(h, int(cy + oy + ry_out) + 1)):
+        dy = py + 0.5 - oy - cy
+        for px in range(max(0, int(cx + ox - rx_out)), min(w, int(cx + ox + rx_out) + 1)):
+            dx = px + 0.5 - ox - cx
+            if (dx / rx_out) ** 2 + (dy / ry_out) ** 2 > 1:
+                continue
+            inside = (dx / rx_in) ** 2 + (dy / ry_in) ** 2 <= 1
+            if outline and not inside:
+                layer[py * w + px] = outline
+            elif fill and (pattern is None or pattern(px, py)):
+                layer[py * w + px] = fill
+
+def point_in_polygon(x, y, points):
+    inside = False
+    j = len(points) - 1
+    for i in range(len(points)):
+        xi, yi = points[i]
+        xj, yj = points[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def distance_to_segment(x, y, a, b):
+    ax, ay = a
+    bx, by = b
+    vx, vy = bx - ax, by - ay
+    length = vx * vx + vy * vy
+    t = 0 if length == 0 else max(0, min(1, ((x - ax) * vx + (y - ay) * vy) / length))
+    return math.hypot(x - ax - t * vx, y - ay - t * vy)
+
+def paint_polygon(layer, size, origin, points, fill=None, outline=None, width=1,
+                  stipple=None):
+    w, h = size
+    ox, oy = origin
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    pattern = stipple_pattern(stipple)
+    edges = list(zip(points, points[1:] + points[:1]))
+    pad = width if outline else 0
+    for py in range(max(0, int(min(ys) + oy - pad)), min(h, int(max(ys) + oy + pad) + 1)):
+        y = py + 0.5 - oy
+        for px in range(max(0, int(min(xs) + ox - pad)), min(w, int(max(xs) + ox + pad) + 1)):
+            x = px + 0.5 - ox
+            if outline and min(distance_to_segment(x, y, a, b) for a, b in edges) <= width / 2:
+                layer[py * w + px] = outline
+            elif fill and point_in_polygon(x, y, points) and (pattern is None or pattern(px, py)):
+                layer[py * w + px] = fill
+
+def composite(*layers):
+    """Stack layers, later ones on top"""
+    result = list(layers[0])
+    for layer in layers[1:]:
+        for i, color in enumerate(layer):
+            if color is not None:
+                result[i] = color
+    return result
+
+class SpriteCache:
+    """PhotoImages for every UFO colour and the ship, keyed by animation frame"""
+    UFO_SIZE = (54, 58)
+    UFO_ORIGIN = (27, 27)
+    CANNON_SIZE = (72, 72)
+    CANNON_ORIGIN = (36, 36)
+
+    def __init__(self, master):
+        import tkinter as tk
+        self.tk = tk
+        self.master = master
+        self.images = {}
+
+    def to_image(self, layer, size):
+        w, h = size
+        image = self.tk.PhotoImage(master=self.master, width=w, height=h)
+        for py in range(h):
+            row = layer[py * w:(py + 1) * w]
+            px = 0
+            while px < w:
+                if row[px] is None:
+                    px += 1
+                    continue
+                start = px
+                while px < w and row[px] is not None:
+                    px += 1
+                image.put("{" + " ".join(row[start:px]) + "}", to=(start, py))
+        return image
+
+    def ufo(self, color, glow_frame, beam_frame):
+        """UFO image for glow_frame (0..GLOW_FRAMES-1) and beam_frame (0 or 1)"""
+        key = ("ufo", color, glow_frame, beam_frame)
+        if key not in self.images:
+            self.build_ufo(color)
+        return self.images[key]
+
+    def build_ufo(self, color):
+        size, origin = self.UFO_SIZE, self.UFO_ORIGIN
+        body = [None] * (size[0] * size[1])
+        # Saucer bottom (darker shade)
+        bottom_color = darken_color(color)
+        paint_oval(body, size, origin, (-18, 5, 18, 15),
+                   fill=bottom_color, outline=darken_color(bottom_color), width=1)
+        # Main saucer body
+        paint_oval(body, size, origin, (-20, -5, 20, 10),
+                   fill=color, outline="#FFFFFF", width=2)
+        # Dome top
+        paint_oval(body, size, origin, (-10, -15, 10, 5),
+                   fill=lighten_color(color), outline="#FFFFFF", width=1)
+        # Cockpit window (glowing)
+        paint_oval(body, size, origin, (-5, -10, 5, 0),
+                   fill="#00FFFF", outline="#FFFFFF", width=1)
+        # Small lights on saucer edge
+        paint_oval(body, size, origin, (-15, 2, -12, 5), fill="#00FF00")
+        paint_oval(body, size, origin, (12, 2, 15, 5), fill="#FF0000")
+        paint_oval(body, size, origin, (-2, 8, 2, 11), fill="#0000FF")
+
+        # Light beam underneath, in two stipple densities
+        beams = []
+        for stipple in ("gray25", "gray50"):
+            beam = [None] * (size[0] * size[1])
+            paint_polygon(beam, size, origin, [(-3, 15), (3, 15), (8, 30), (-8, 30)],
+                          fill="#FFFF00", stipple=stipple)
+            beams.append(beam)
+        # Outer glow, pulsing +-3px around a 22px radius
+        for glow_frame in range(GLOW_FRAMES):
+            r = 22 + (glow_frame / (GLOW_FRAMES - 1) * 2 - 1) * 3
+            glow = [None] * (size[0] * size[1])
+            paint_oval(glow, size, origin, (-r, -r, r, r), outline=color, width=2)
+            for beam_frame, beam in enumerate(beams):
+                self.images[("ufo", color, glow_frame, beam_frame)] = self.to_image(
+                    composite(beam, glow, body), size)
+
+    def cannon(self, glow_frame, engine_frame):
+        """Ship image for glow_frame (0..GLOW_FRAMES-1) and engine_frame (index into ENGINE_COLORS)"""
+        key = ("cannon", glow_frame, engine_frame)
+        if key not in self.images:
+            self.build_cannon()
+        return self.images[key]
+
+    def build_cannon(self):
+        size, origin = self.CANNON_SIZE, self.CANNON_ORIGIN
+        body = [None] * (size[0] * size[1])
+        # Main fuselage (body)
+        paint_polygon(body, size, origin, [(0, -25), (12, -10), (10, 5), (-10, 5), (-12, -10)],
+                      fill="#2E86AB", outline="#1A5F7A", width=2)
+        # Wings
+        paint_polygon(body, size, origin, [(-12, -8), (-25, 0), (-20, 3), (-10, -5)],
+                      fill="#1A5F7A", outline="#0D3B52", width=2)
+        paint_polygon(body, size, origin, [(12, -8), (25, 0), (20, 3), (10, -5)],
+                      fill="#1A5F7A", outline="#0D3B52", width=2)
+        # Cockpit window
+        paint_oval(body, size, origin, (-5, -18, 5, -8),
+                   fill="#00FFFF", outline="#FFFFFF", width=1)
+        # Weapon barrels
+        paint_polygon(body, size, origin, [(-15, -15), (-13, -15), (-13, -5), (-15, -5)],
+                      fill="#FF6B35", outline="#C44900", width=1)
+        paint_polygon(body, size, origin, [(13, -15), (15, -15), (15, -5), (13, -5)],
+                      fill="#FF6B35", outline="#C44900", width=1)
+
+        # Engine glow (bottom thrusters); the two engines flicker out of step
+        engines = []
+        for engine_frame in range(len(ENGINE_COLORS)):
+            engine = [None] * (size[0] * size[1])
+            paint_oval(engine, size, origin, (-18, -5, -10, 8),
+                       fill=ENGINE_COLORS[engine_frame], outline="#0088FF", width=2)
+            paint_oval(engine, size, origin, (10, -5, 18, 8),
+                       fill=ENGINE_COLORS[(engine_frame + 2) % len(ENGINE_COLORS)],
+                       outline="#0088FF", width=2)
+            engines.append(engine)
+        # Outer glow aura, pulsing between 25px and 35px
+        for glow_frame in range(GLOW_FRAMES):
+            r = 30 + (glow_frame / (GLOW_FRAMES - 1) * 2 - 1) * 5
+            glow = [None] * (size[0] * size[1])
+            paint_oval(glow, size, origin, (-r, -r, r, r), outline="#00FFFF", width=2)
+            for engine_frame, engine in enumerate(engines):
+                self.images[("cannon", glow_frame, engine_frame)] = self.to_image(
+                    composite(engine, glow, body), size)
+
+def glow_frame(phase):
+    """Quantize a sine phase to one of the cached glow frames"""
+    return round((math.sin(phase) + 1) / 2 * (GLOW_FRAMES - 1))
+
+# ===== Starfield Background =====
+class Star:
+    def __init__(self, cv, rng):
+        self.cv = cv
+        self.rng = rng
+        self.x = rng.randint(0, WINDOW_WIDTH)
+        self.y = rng.randint(0, WINDOW_HEIGHT)
+        self.speed = rng.uniform(0.2, 0.8)  # Slower movement
+        self.size = rng.randint(1, 2)  # Smaller stars
+        # More subtle, dimmer colors
+        brightness = rng.choice(['#444444', '#555555', '#666666', '#4A5568'])
+        self.id = cv.create_oval(
+            self.x, self.y, self.x + self.size, self.y + self.size,
+            fill=brightness, outline=""
+        )
+
+    def update(self):
+        self.y += self.speed
+        if self.y > WINDOW_HEIGHT:
+            self.y = 0
+            self.x = self.rng.randint(0, WINDOW_WIDTH)
+        self.cv.coords(self.id, self.x, self.y, self.x + self.size, self.y + self.size)
+
+# ===== トゥイーン (一時的な演出) =====
+def hex_to_rgb(hex_color):
+    return tuple(int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+
+class Tween:
+    """One running animation of a canvas item
+
+    coords is a (start, end) pair of coordinate tuples and color a
+    (start, end) pair of hex colours for the item option named by option.
+    on_step(t) runs on every update and on_done(item) once at the end.
+    """
+    def __init__(self, item, duration_ms, coords=None, color=None, option="fill",
+                 on_step=None, on_done=None):
+        self.item = item
+        self.duration_ms = duration_ms
+        self.elapsed_ms = 0
+        self.coords = coords
+        self.color = color and (hex_to_rgb(color[0]), hex_to_rgb(color[1]))
+        self.option = option
+        self.on_step = on_step
+        self.on_done = on_done
+
+class TweenEngine:
+    """Every active tween in one list, advanced by a single scheduler system"""
+    def __init__(self, cv):
+        self.cv = cv
+        self.tweens = []
+
+    def add(self, item, duration_ms, **kwargs):
+        """Start a tween; the item is put in its start state straight away"""
+        tween = Tween(item, duration_ms, **kwargs)
+        self.apply(tween, 0.0)
+        self.tweens.append(tween)
+        return tween
+
+    def apply(self, tween, t):
+        if tween.coords is not None:
+            start, end = tween.coords
+            self.cv.coords(tween.item, *[a + (b - a) * t for a, b in zip(start, end)])
+        if tween.color is not None:
+            start, end = tween.color
+            r, g, b = (round(a + (b - a) * t) for a, b in zip(start, end))
+            self.cv.itemconfig(tween.item, **{tween.option: f"#{r:02X}{g:02X}{b:02X}"})
+        if tween.on_step is not None:
+            tween.on_step(t)
+
+    def step(self, dt_ms=TWEEN_STEP):
+        active, self.tweens = self.tweens, []
+        running = []
+        for tween in active:
+            tween.elapsed_ms += dt_ms
+            t = min(1.0, tween.elapsed_ms / tween.duration_ms)
+            self.apply(tween, t)
+            if t < 1.0:
+                running.append(tween)
+            elif tween.on_done is not None:
+                tween.on_done(tween.item)
+        # Tweens started by on_done callbacks go after the survivors
+        self.tweens = running + self.tweens
+
+    def clear(self):
+        self.tweens = []
+
+class ItemPool:
+    """Canvas items of one kind that are hidden and reused instead of deleted"""
+    def __init__(self, cv, create):
+        self.cv = cv
+        self.create = create
+        self.free = []
+
+    def acquire(self):
+        if self.free:
+            item = self.free.pop()
+            self.cv.itemconfig(item, state="normal")
+            return item
+        return self.create()
+
+    def release(self, item):
+        self.cv.itemconfig(item, state="hidden")
+        self.free.append(item)
+
+# ===== 描画 (tkinter) =====
+class TkRenderer:
+    """Draws an InvaderSim on a Tk canvas; the canvas is only written to"""
+    def __init__(self, cv, sim):
+        self.cv = cv
+        self.sim = sim
+        self.sprites = SpriteCache(cv)
+        # Visual randomness has its own stream so drawing never shifts the
+        # simulation's sequence
+        self.rng = random.Random()
+        self.glow_phase = 0
+        self.pulse_phase = 0
+        self.beam_phase = 0
+        self.shake = None  # running shake tween
+        self.shake_intensity = 0
+        self.camera = (0, 0)
+        self.quality = sim.quality
+        self.tweens = TweenEngine(cv)
+        # Shake scrolls the view over a slightly larger scroll region, so no
+        # item is ever moved and logic coordinates stay canvas coordinates
+        cv.configure(scrollregion=(-SHAKE_MARGIN, -SHAKE_MARGIN,
+                                   WINDOW_WIDTH + SHAKE_MARGIN,
+                                   WINDOW_HEIGHT + SHAKE_MARGIN))
+        self.set_camera(0, 0)
+        self.register_systems()
+        self.reset()
+
+    def register_systems(self):
+        """Visual-only animations run on the simulation's scheduler"""
+        scheduler = self.sim.scheduler
+        scheduler.register_system("starfield", self.update_starfield, 80)
+        scheduler.register_system("tweens", self.tweens.step, TWEEN_STEP)
+        scheduler.register_system("enemy_anim", self.animate_enemies, 50)
+        scheduler.register_system("cannon_anim", self.animate_cannon, 50)
+
+    def reset(self):
+        """Throw away every canvas item and rebuild from the simulation"""
+        cv = self.cv
+        cv.delete("all")
+        self.tweens.clear()
+        self.shake = None
+        self.set_camera(0, 0)
+        self.flash_pool = ItemPool(cv, lambda: cv.create_oval(
+            0, 0, 0, 0, fill="yellow", outline="orange", width=2))
+        self.ring_pool = ItemPool(cv, lambda: cv.create_oval(
+            0, 0, 0, 0, outline="yellow", width=3, fill=""))
+        self.text_pool = ItemPool(cv, lambda: cv.create_text(0, 0, text=""))
+        self.rng.seed(self.sim.seed)
+        self.stars = []
+        self.create_starfield()
+        self.set_quality(self.quality)
+        self.cannon_id = None
+        self.create_cannon(self.sim.cannon_x, self.sim.cannon_y)
+        self.ufo_frames = {}  # animation tag -> (glow_frame, beam_frame) on screen
+        self.formation_drawn = None  # formation object on screen
+        self.build_formation()
+        self.bullet_items = {}
+        for pool, fill, outline, glow in (
+                (self.sim.my_bullets, "cyan", "white", "cyan"),
+                (self.sim.enemy_bullets, "#FF0000", "orange", "red")):
+            self.bullet_items[id(pool)] = {
+                "style": (fill, outline, glow),
+                "rect": [None] * pool.capacity,
+                "glow": [None] * pool.capacity,
+                "visible": set(),
+                "drawn": [None] * pool.capacity,  # (x, y) the items were last moved to
+            }
+        self.particle_items = [None] * self.sim.particles.capacity
+        self.particle_serial = [0] * self.sim.particles.capacity
+        self.particle_drawn = [None] * self.sim.particles.capacity  # (x, y, size)
+        self.particle_visible = set()
+        self.overlay_id = None
+        self.score_drawn = None
+        self.score_id = cv.create_text(
+            10, 10, anchor="nw", text="", fill="white",
+            font=("System", TEXT_GOOD_SIZE + 2, "bold")
+        )
+
+    def render(self):
+        """Write the current simulation state to the canvas"""
+        sim = self.sim
+        for event in sim.events:
+            self.handle_event(event)
+        sim.events.clear()
+        self.render_cannon()
+        self.render_enemies()
+        self.render_bullets(sim.my_bullets)
+        self.render_bullets(sim.enemy_bullets)
+        self.render_particles()
+        if sim.score != self.score_drawn:
+            self.score_drawn = sim.score
+            self.cv.itemconfig(self.score_id, text=f"SCORE {sim.score}")
+
+    def render_overlay(self, lines):
+        """Show instrumentation text in the top-right corner; None hides it"""
+        if lines is None:
+            if self.overlay_id is not None:
+                self.cv.delete(self.overlay_id)
+                self.overlay_id = None
+            return
+        if self.overlay_id is None:
+            self.overlay_id = self.cv.create_text(
+                WINDOW_WIDTH - 10, 10, anchor="ne", text="", fill="#9AE6B4",
+                font=("Courier", 9), justify="left"
             )
-    root.after(50, pulse_enemies)
-
-def enemy_random_shoot():
-    alive_indexes = [i for i, e in enumerate(enemies) if e["exist"]]
-    if alive_indexes:
-        idx = random.choice(alive_indexes)
-        enemy = enemies[idx]
-        create_enemy_bullet(enemy["x"], enemy["y"])
-    root.after(ENEMY_SHOOT_INTERVAL, enemy_random_shoot)
-
-# ===== 敵の弾まわり =====
-def create_enemy_bullet(x, y):
-    bullet_id = cv.create_rectangle(
-        x - BULLET_WIDTH, y + BULLET_HEIGHT,
-        x + BULLET_WIDTH, y - BULLET_HEIGHT,
-        fill="#FF0000", outline="orange", width=1
-    )
-    glow_id = cv.create_oval(
-        x - 8, y - 8, x + 8, y + 8,
-        fill="", outline="red", width=2
-    )
-    bullet = {
-        "x": x,
-        "y": y,
-        "id": bullet_id,
-        "glow_id": glow_id,
-        "alive": True
-    }
-    enemy_bullets.append(bullet)
-    index = len(enemy_bullets) - 1
-    shoot_enemy_bullet(index)
+        self.cv.itemconfig(self.overlay_id, text="\n".join(lines))
 
-def shoot_enemy_bullet(index):
-    bullet = enemy_bullets[index]
-    if not bullet["alive"]:
-        return
-    if bullet["y"] <= WINDOW_HEIGHT:
-        # Create trail particle - reduced frequency
-        if random.random() < 0.15:  # Reduced from 0.3 to 0.15
-            particles.append(Particle(
-                bullet["x"], bullet["y"], 
-                random.uniform(-0.5, 0.5), random.uniform(-1, 0),
-                "red", 2, 15
-            ))
-        
-        cv.move(bullet["id"], 0, BULLET_HEIGHT)
-        cv.move(bullet["glow_id"], 0, BULLET_HEIGHT)
-        bullet["y"] += BULLET_HEIGHT
-        collision_enemy_bullet(index)
-        root.after(BULLET_SPEED, lambda i=index: shoot_enemy_bullet(i))
-    else:
-        destroy_enemy_bullet(index)
-
-def collision_enemy_bullet(index):
-    global cannon_exist
-    if not cannon_exist or not cannon_id or "fuselage" not in cannon_id:
-        return
-    bullet = enemy_bullets[index]
-    if not bullet["alive"]:
-        return
-    cannon_coords = cv.coords(cannon_id["fuselage"])
-    bullet_coords = cv.coords(bullet["id"])
-    if check_collision_rect(bullet_coords, cannon_coords):
-        # Create explosion at cannon position
-        create_explosion(cannon_x, cannon_y, 
-                       ["red", "orange", "yellow", "white"])
-        screen_shake(15, 300)
-        gameover()
-
-def destroy_enemy_bullet(index):
-    bullet = enemy_bullets[index]
-    if bullet["alive"]:
-        bullet["alive"] = False
-        cv.delete(bullet["id"])
-        if "glow_id" in bullet:
-            cv.delete(bullet["glow_id"])
+    def handle_event(self, event):
+        kind = event[0]
+        if kind == "shot":
+            self.create_muzzle_flash(event[1], event[2])
+        elif kind == "enemy_destroyed":
+            x, y, index = event[1], event[2], event[3]
+            # Delete all UFO parts
+            self.cv.delete(f"enemy{index}")
+            # Create expanding ring effect
+            self.create_ring_effect(x, y)
+            # Animated text
+            self.float_text(x, y, "BOOM!", "#FFFF00", TEXT_GOOD_SIZE * 2)
+        elif kind == "game_over":
+            self.destroy_cannon()
+            self.screen_shake(15, 300)
+            self.show_gameover()
+        elif kind == "game_clear":
+            self.show_gameclear()
+        elif kind == "wave_start":
+            self.float_text(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2,
+                            f"WAVE {event[1]}", "#FFFFFF", TEXT_GOOD_SIZE * 3)
 
-# ===== 共通: 四角どうしの当たり判定 =====
-def check_collision_rect(a, b):
-    return (b[0] < a[0] < b[2] and b[1] < a[1] < b[3])
-
-# ===== GAME CLEAR / GAME OVER =====
-def gameover():
-    global cannon_exist
-    cannon_exist = False
-    destroy_cannon()
-    cv.create_text(
-        WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2,
-        text="GAME OVER", fill="red",
-        font=("System", TEXT_GAMEOVER_SIZE, "bold"),
-        tags="game_over_text"
-    )
-    cv.create_text(
-        WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 80,
-        text="Press R to Restart", fill="white",
-        font=("System", 20),
-        tags="game_over_text"
-    )
-    # Bind restart key
-    root.bind("<KeyPress-r>", lambda e: reset_game())
-    root.bind("<KeyPress-R>", lambda e: reset_game())
-
-def reset_game():
-    """Reset the game to initial state"""
-    global cannon_exist, enemies, my_bullets, enemy_bullets, particles, stars
-    
-    # Delete ALL canvas items (including game over text, enemies, bullets, particles)
-    cv.delete("all")
-    
-    # Clear particle objects
-    for particle in particles:
-        particle.destroy()
-    
-    # Reset game state lists
-    enemies.clear()
-    my_bullets.clear()
-    enemy_bullets.clear()
-    particles.clear()
-    stars.clear()
-    
-    # Recreate starfield background
-    create_starfield()
-    
-    # Recreate game objects
-    create_cannon(WINDOW_WIDTH // 2, CANNON_Y)
-    create_enemies()
-    enemy_random_shoot()
-    gameclear()
-
-def gameclear():
-    winflag = 0
-    for enemy in enemies:
-        if not enemy["exist"]:
-            winflag += 1
-    if winflag == NUMBER_OF_ENEMY:
-        cv.create_text(
+    def set_quality(self, settings):
+        """Apply a quality tier: only the first settings["stars"] stars are shown"""
+        self.quality = settings
+        for i, star in enumerate(self.stars):
+            self.cv.itemconfig(star.id, state="normal" if i < settings["stars"] else "hidden")
+
+    # ----- Starfield -----
+    def create_starfield(self):
+        """Create animated starfield background, enough for the best tier"""
+        for _ in range(QUALITY_TIERS[0]["stars"]):
+            self.stars.append(Star(self.cv, self.rng))
+
+    def update_starfield(self):
+        """Update starfield animation"""
+        for star in self.stars[:self.quality["stars"]]:
+            star.update()
+
+    # ----- Screen Shake Effect -----
+    def screen_shake(self, intensity=10, duration=200):
+        """Apply screen shake effect by offsetting the camera"""
+        if self.shake is None:
+            self.shake_intensity = intensity
+            self.shake = self.tweens.add(None, duration, on_step=self.shake_camera,
+                                         on_done=self.end_shake)
+        else:
+            # Already shaking: extend the running tween
+            self.shake_intensity = max(self.shake_intensity, intensity)
+            self.shake.duration_ms = max(self.shake.duration_ms,
+                                         self.shake.elapsed_ms + duration)
+
+    def shake_camera(self, t):
+        intensity = min(self.shake_intensity, SHAKE_MARGIN)
+        self.set_camera(self.rng.randint(-intensity, intensity),
+                        self.rng.randint(-intensity, intensity))
+
+    def end_shake(self, item):
+        self.shake = None
+        self.set_camera(0, 0)
+
+    def set_camera(self, offset_x, offset_y):
+        """Show the play field shifted by (offset_x, offset_y) pixels"""
+        self.camera = (offset_x, offset_y)
+        self.cv.xview_moveto((SHAKE_MARGIN - offset_x) / (WINDOW_WIDTH + 2 * SHAKE_MARGIN))
+        self.cv.yview_moveto((SHAKE_MARGIN - offset_y) / (WINDOW_HEIGHT + 2 * SHAKE_MARGIN))
+
+    # ----- 自機まわり -----
+    def create_cannon(self, x, y):
+        self.cannon_drawn_x = x
+        self.cannon_frame = (glow_frame(self.glow_phase), 0)
+        ox, oy = SpriteCache.CANNON_ORIGIN
+        self.cannon_id = self.cv.create_image(
+            x - ox, y - oy, anchor="nw",
+            image=self.sprites.cannon(*self.cannon_frame), tags="cannon"
+        )
+
+    def render_cannon(self):
+        if not self.cannon_id:
+            return
+        dx = self.sim.cannon_x - self.cannon_drawn_x
+        if dx:
+            self.cannon_drawn_x = self.sim.cannon_x
+            self.cv.move(self.cannon_id, dx, 0)
+
+    def animate_cannon(self):
+        """Pulse the glow aura and flicker the engines by swapping cached frames"""
+        if not self.cannon_id or not self.quality["glow"]:
+            return
+        self.glow_phase += 0.1
+        engine = self.cannon_frame[1]
+        if self.sim.scheduler.tick_count % 10 == 0:
+            engine = self.rng.randrange(len(ENGINE_COLORS))
+        frame = (glow_frame(self.glow_phase), engine)
+        if frame != self.cannon_frame:
+            self.cannon_frame = frame
+            self.cv.itemconfig(self.cannon_id, image=self.sprites.cannon(*frame))
+
+    def create_muzzle_flash(self, x, y):
+        """Create muzzle flash effect when shooting"""
+        flash_id = self.flash_pool.acquire()
+        self.cv.coords(flash_id, x - 15, y - 15, x + 15, y + 15)
+        self.tweens.add(flash_id, 50, on_done=self.flash_pool.release)
+
+    def destroy_cannon(self):
+        if self.cannon_id:
+            self.cv.delete(self.cannon_id)
+            self.cannon_id = None
+
+    # ----- 弾 -----
+    def render_bullets(self, pool):
+        """Show, move and hide the reused canvas items of a bullet pool
+
+        Bullets move every BULLET_STEP, less often than frames are drawn,
+        so slots still where they were last drawn are skipped.
+        """
+        cv = self.cv
+        items = self.bullet_items[id(pool)]
+        rects, glows, visible = items["rect"], items["glow"], items["visible"]
+        drawn = items["drawn"]
+        for slot in list(visible):
+            if not pool.alive[slot]:
+                cv.itemconfig(rects[slot], state="hidden")
+                cv.itemconfig(glows[slot], state="hidden")
+                visible.discard(slot)
+        for slot, _ in pool.handles():
+            if rects[slot] is None:
+                fill, outline, glow = items["style"]
+                rects[slot] = cv.create_rectangle(
+                    0, 0, 0, 0, fill=fill, outline=outline, width=1, state="hidden"
+                )
+                glows[slot] = cv.create_oval(
+                    0, 0, 0, 0, fill="", outline=glow, width=2, state="hidden"
+                )
+            x = pool.x[slot]
+            y = pool.y[slot]
+            if drawn[slot] != (x, y):
+                drawn[slot] = (x, y)
+                cv.coords(rects[slot],
+                          x - BULLET_WIDTH, y + BULLET_HEIGHT,
+                          x + BULLET_WIDTH, y - BULLET_HEIGHT)
+                cv.coords(glows[slot], x - 8, y - 8, x + 8, y + 8)
+            if slot not in visible:
+                cv.itemconfig(rects[slot], state="normal")
+                cv.itemconfig(glows[slot], state="normal")
+                visible.add(slot)
+
+    # ----- パーティクル -----
+    def render_particles(self):
+        cv = self.cv
+        engine = self.sim.particles
+        items = self.particle_items
+        live = set(engine.live)
+        for slot in self.particle_visible - live:
+            cv.itemconfig(items[slot], state="hidden")
+        xs, ys, sizes = engine.x, engine.y, engine.size
+        drawn = self.particle_drawn
+        for slot in engine.live:
+            item = items[slot]
+            if item is None:
+                item = cv.create_oval(0, 0, 0, 0, outline="", state="hidden")
+                items[slot] = item
+            # Particles move every 20 ms; skip the frames in between
+            x = xs[slot]
+            y = ys[slot]
+            size = sizes[slot]
+            if drawn[slot] != (x, y, size):
+                drawn[slot] = (x, y, size)
+                cv.coords(item, x - size, y - size, x + size, y + size)
+            if self.particle_serial[slot] != engine.serial[slot]:
+                self.particle_serial[slot] = engine.serial[slot]
+                cv.itemconfig(item, fill=engine.color[slot], state="normal")
+        self.particle_visible = live
+
+    # ----- 敵まわり -----
+    def create_ufo(self, index, x, y, color):
+        """Create a UFO flying saucer as a single image item
+
+        The item is tagged "formation" (moved as one), "enemy<index>"
+        (deleted on a kill) and with an animation tag shared by every UFO of
+        the same colour and animation group.
+        """
+        tag = f"ufo{color[1:]}_{index % 2}"
+        frame = self.ufo_frames.setdefault(tag, (0, 0))
+        ox, oy = SpriteCache.UFO_ORIGIN
+        self.cv.create_image(
+            x - ox, y - oy, anchor="nw",
+            image=self.sprites.ufo(color, *frame),
+            tags=("formation", f"enemy{index}", tag)
+        )
+
+    def build_formation(self):
+        """Replace the UFO items with the simulation's current formation"""
+        formation = self.sim.formation
+        self.cv.delete("formation")
+        for index in formation.live_indexes():
+            x, y = formation.position(index)
+            self.create_ufo(index, x, y, formation.color[index])
+        self.formation_drawn = formation
+        self.formation_origin = (formation.x, formation.y)
+
+    def render_enemies(self):
+        """Move the whole formation with a single tag-based move"""
+        formation = self.sim.formation
+        if formation is not self.formation_drawn:
+            self.build_formation()
+        old_x, old_y = self.formation_origin
+        dx = formation.x - old_x
+        dy = formation.y - old_y
+        if dx or dy:
+            self.formation_origin = (formation.x, formation.y)
+            self.cv.move("formation", dx, dy)
+
+    def animate_enemies(self):
+        """Pulse the glow and beam of every UFO, one itemconfig per colour and group"""
+        if not self.quality["glow"]:
+            return
+        self.pulse_phase += 0.1
+        self.beam_phase += 0.075
+        for tag, old_frame in self.ufo_frames.items():
+            group = int(tag[-1])
+            frame = (glow_frame(self.pulse_phase + group * math.pi),
+                     0 if math.sin(self.beam_phase + group * math.pi) > 0 else 1)
+            if frame != old_frame:
+                self.ufo_frames[tag] = frame
+                color = "#" + tag[3:-2]
+                self.cv.itemconfig(tag, image=self.sprites.ufo(color, *frame))
+
+    # ----- エフェクト -----
+    def create_ring_effect(self, x, y):
+        """Create expanding ring effect"""
+        ring_id = self.ring_pool.acquire()
+        self.tweens.add(ring_id, 200,
+                        coords=((x - 5, y - 5, x + 5, y + 5),
+                                (x - 35, y - 35, x + 35, y + 35)),
+                        color=("#FFFF00", BACKGROUND_COLOR), option="outline",
+                        on_done=self.ring_pool.release)
+
+    def float_text(self, x, y, text, color, size):
+        """Animate text floating up and fading"""
+        text_id = self.text_pool.acquire()
+        self.cv.itemconfig(text_id, text=text, font=("System", size, "bold"))
+        self.tweens.add(text_id, 600, coords=((x, y), (x, y - 40)),
+                        color=(color, BACKGROUND_COLOR),
+                        on_done=self.text_pool.release)
+
+    # ----- GAME CLEAR / GAME OVER -----
+    def show_gameover(self):
+        self.cv.create_text(
+            WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2,
+            text="GAME OVER", fill="red",
+            font=("System", TEXT_GAMEOVER_SIZE, "bold"),
+            tags="game_over_text"
+        )
+        self.cv.create_text(
+            WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 80,
+            text="Press R to Restart", fill="white",
+            font=("System", 20),
+            tags="game_over_text"
+        )
+
+    def show_gameclear(self):
+        self.cv.create_text(
             WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 80,
             text="Congratulations!", fill="lime",
             font=("System", TEXT_CONGRATULATIONS_SIZE)
         )
-        cv.create_text(
+        self.cv.create_text(
             WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 + 20,
             text="GAME CLEAR!", fill="lime",
             font=("System", TEXT_GAMECLEAR_SIZE)
         )
 
-# ===== メイン処理 =====
-if __name__ == "__main__":
-    root = tk.Tk()
-    root.title("🚀 SPACE INVADERS - ENHANCED EDITION 🚀")
-    cv = tk.Canvas(root, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, bg="#0a0a1a")
-    cv.pack()
+# ===== 入力と起動 (tkinter) =====
+class TkGame:
+    """Wires Tk events to an InvaderSim and draws it with a TkRenderer"""
+    def __init__(self, root, cv, seed=None, record_path=None, replay=None,
+                 waves=None, endless=False, quality=None):
+        self.root = root
+        self.cv = cv
+        self.replay = replay
+        self.record_path = record_path
+        if replay is not None:
+            seed, endless = replay.seed, replay.endless
+        self.sim = InvaderSim(seed, waves or load_waves(), endless)
+        self.recorder = InputRecorder(self.sim.seed)
+        self.timers = TimerRegistry(root)
+        self.renderer = TkRenderer(cv, self.sim)
+        self.pending = Inputs()
+        self.held = set()  # keysyms currently down
+        self.releasing = {}  # keysym -> timer id of its pending release
+        # A fixed quality name pins that tier; otherwise frame time picks it
+        self.governor = QualityGovernor()
+        self.governor.on_change = self.apply_quality
+        if quality is None:
+            self.sim.scheduler.governor = self.governor
+        else:
+            names = [tier["name"] for tier in QUALITY_TIERS]
+            self.governor.set_tier(names.index(quality))
+        self.profiler = FrameProfiler()
+        self.profiler.probes = {
+            "canvas_items": lambda: len(self.cv.find_all()),
+            "after_pending": lambda: len(self.root.tk.splitlist(
+                self.root.tk.call("after", "info"))),
+            "live": self.live_callbacks,
+            "wave": lambda: self.sim.wave,
+            "quality": self.governor.describe,
+            "tweens": lambda: len(self.renderer.tweens.tweens),
+        }
+        self.trace_path = os.environ.get(TRACE_ENV)
+        self.bind_inputs()
+        if os.environ.get(PROFILE_ENV, "") not in ("", "0") or self.trace_path:
+            self.toggle_profiler()
+
+    def bind_inputs(self):
+        cv = self.cv
+        cv.tag_bind("cannon", "<ButtonPress-3>", self.cannon_pressed)
+        cv.tag_bind("cannon", "<Button1-Motion>", self.cannon_dragged)
+        self.root.bind("<KeyPress>", self.on_key_press)
+        self.root.bind("<KeyRelease>", self.on_key_release)
+
+    # Event handlers only record state; tick() turns it into one Inputs per
+    # tick, so a fast mouse or key auto-repeat costs nothing extra
+    def cannon_pressed(self, event):
+        self.pending.fire_x.append(self.cv.canvasx(event.x))
+
+    def cannon_dragged(self, event):
+        self.pending.pointer_x = self.cv.canvasx(event.x)
+
+    def on_key_press(self, event):
+        timer_id = self.releasing.pop(event.keysym, None)
+        if timer_id is not None:
+            # X11 reports an OS auto-repeat as a release and a press: the key
+            # never went up, so keep it held without a new fire press
+            self.timers.cancel(timer_id)
+        if event.keysym in ("Left", "Right"):
+            self.held.add(event.keysym)
+        elif event.keysym == "space":
+            if "space" not in self.held:  # auto-repeat is covered by fire_held
+                self.held.add("space")
+                self.pending.fire_x.append(None)
+        elif event.keysym in ("r", "R") and self.sim.game_over:
+            self.reset_game()
+        elif event.keysym == "F3":
+            self.toggle_profiler()
+        elif event.keysym == "F4":
+            self.dump_trace()
+
+    def on_key_release(self, event):
+        """Drop the key after RELEASE_DEBOUNCE_MS unless it is pressed again first"""
+        keysym = event.keysym
+        if keysym in self.releasing:
+            return
+        def release():
+            del self.releasing[keysym]
+            self.held.discard(keysym)
+        self.releasing[keysym] = self.timers.after("game", RELEASE_DEBOUNCE_MS, release)
+
+    def apply_quality(self, settings):
+        self.sim.quality = settings
+        self.renderer.set_quality(settings)
+        if self.sim.scheduler.governor is not None:
+            print(f"quality {self.governor.describe()}", file=sys.stderr)
+
+    def live_callbacks(self):
+        """Registered systems and pending timers per scope, e.g. 'engine:13 game:2'"""
+        counts = self.sim.scheduler.counts()
+        for scope, count in self.timers.counts().items():
+            counts[scope] = counts.get(scope, 0) + count
+        return " ".join(f"{scope}:{count}" for scope, count in sorted(counts.items()))
+
+    def toggle_profiler(self):
+        scheduler = self.sim.scheduler
+        if scheduler.profiler is None:
+            scheduler.profiler = self.profiler
+        else:
+            scheduler.profiler = None
+            self.renderer.render_overlay(None)
+
+    def dump_trace(self):
+        path = self.trace_path or DEFAULT_TRACE_PATH
+        self.profiler.dump_csv(path)
+        print(f"wrote {len(self.profiler.trace)} frames to {path}", file=sys.stderr)
 
-    # Create animated starfield background
-    create_starfield()
-    update_starfield()
+    def render(self):
+        self.renderer.render()
+        profiler = self.sim.scheduler.profiler
+        if profiler is not None and profiler.frame_count % PROBE_EVERY == 0:
+            self.renderer.render_overlay(profiler.summary_lines())
 
-    # Start particle system
-    update_particles()
+    def tick(self):
+        inputs, self.pending = self.pending, Inputs()
+        inputs.move_x = ("Right" in self.held) - ("Left" in self.held)
+        inputs.fire_held = "space" in self.held
+        if self.replay is not None:
+            inputs = self.replay.inputs_for(self.sim.tick)
+        self.recorder.record(inputs)
+        was_running = not (self.sim.game_over or self.sim.game_clear)
+        wave = self.sim.wave
+        self.sim.step(inputs)
+        if self.sim.wave != wave:
+            self.log_wave()
+        if was_running and (self.sim.game_over or self.sim.game_clear):
+            self.save_recording()
 
-    # 自機を作る
-    create_cannon(WINDOW_WIDTH // 2, CANNON_Y)
+    def log_wave(self):
+        """Log the new wave next to the frame time it is being played at"""
+        profiler = self.sim.scheduler.profiler
+        if profiler is None and not self.sim.endless:
+            return
+        line = f"wave {self.sim.wave} enemies {self.sim.formation.live_count}"
+        if profiler is not None:
+            p50, p95, p99 = profiler.percentiles(50, 95, 99)
+            line += f" frame p50 {p50:.2f} p95 {p95:.2f} p99 {p99:.2f} ms"
+        print(line, file=sys.stderr)
 
-    # 敵を作って動かす
-    create_enemies()
+    def save_recording(self):
+        if self.record_path and self.replay is None:
+            self.recorder.save(self.record_path, self.sim)
 
-    # 敵のランダムショット開始
-    enemy_random_shoot()
+    def reset_game(self):
+        """Reset the game to initial state"""
+        self.replay = None
+        # Stop everything that belonged to the finished round; a key whose
+        # release was still pending is up
+        self.timers.cancel_scope("game")
+        for keysym in self.releasing:
+            self.held.discard(keysym)
+        self.releasing.clear()
+        self.sim.reset()
+        self.recorder = InputRecorder(self.sim.seed)
+        self.renderer.reset()
+        self.bind_inputs()
 
-    # クリア判定開始
-    gameclear()
+    def start(self):
+        self.sim.scheduler.start(self.timers, self.tick, self.render)
 
-    # キーボード操作のバインド
-    root.bind("<KeyPress>", on_key_press)
+    def close(self):
+        self.save_recording()
+        if self.trace_path and self.profiler.trace:
+            self.dump_trace()
+        self.root.destroy()
+
+# ===== メイン処理 =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Space invaders")
+    parser.add_argument("--headless", type=int, metavar="TICKS",
+                        help="run TICKS simulation ticks without a display and report ticks/s")
+    parser.add_argument("--profile", action="store_true",
+                        help="with --headless, print per-subsystem timings")
+    parser.add_argument("--seed", type=int, help="seed for a reproducible game")
+    parser.add_argument("--record", metavar="PATH",
+                        help="save the seed and per-tick inputs of each game to PATH")
+    parser.add_argument("--replay", metavar="PATH", help="play back a recorded game")
+    parser.add_argument("--verify", action="store_true",
+                        help="with --replay, re-run it headless and check the final state")
+    parser.add_argument("--bench", nargs="*", metavar="SCENARIO",
+                        choices=sorted(BENCH_SCENARIOS),
+                        help="run headless stress scenarios (default: all)")
+    parser.add_argument("--ticks", type=int, default=BENCH_TICKS,
+                        help="ticks per benchmark scenario")
+    parser.add_argument("--waves", metavar="PATH", default=WAVES_FILE,
+                        help="wave definitions (JSON)")
+    parser.add_argument("--endless", action="store_true",
+                        help="keep generating bigger waves after the last one; "
+                             "with --headless, run the endless load test")
+    parser.add_argument("--quality", choices=[tier["name"] for tier in QUALITY_TIERS],
+                        help="pin the effect quality instead of adapting it to frame time")
+    args = parser.parse_args(argv)
+    waves = load_waves(args.waves)
+    if args.endless and waves["endless"] is None:
+        parser.error(f"--endless needs an \"endless\" section in {args.waves}")
+
+    if args.bench is not None:
+        run_benchmark(args.bench or list(BENCH_SCENARIOS), args.ticks,
+                      BENCH_SEED if args.seed is None else args.seed)
+        return
+
+    replay = ReplayPlayer.load(args.replay) if args.replay else None
+    if replay is not None and args.verify:
+        sim, ok = replay.run_headless(waves)
+        print(f"{'OK' if ok else 'MISMATCH'}: {sim.state_digest()} (recorded {replay.digest})")
+        sys.exit(0 if ok else 1)
+
+    if args.headless and args.endless:
+        run_endless(args.headless, args.seed, waves)
+        return
+
+    if args.headless:
+        profiler = FrameProfiler() if args.profile else None
+        rate = run_headless(args.headless, profiler, args.seed)
+        print(f"{args.headless} ticks, {rate:.0f} ticks/s")
+        if profiler is not None:
+            print("\n".join(profiler.summary_lines()))
+            if os.environ.get(TRACE_ENV):
+                profiler.dump_csv(os.environ[TRACE_ENV])
+        return
+
+    import tkinter as tk
+    root = tk.Tk()
+    root.title("🚀 SPACE INVADERS - ENHANCED EDITION 🚀")
+    cv = tk.Canvas(root, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, bg=BACKGROUND_COLOR,
+                   highlightthickness=0)
+    cv.pack()
+
+    game = TkGame(root, cv, args.seed, args.record, replay, waves, args.endless,
+                  args.quality)
+    root.protocol("WM_DELETE_WINDOW", game.close)
+    game.start()
 
     root.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
-import turtle
+import argparse
+import bisect
+import json
 import random
+import statistics
+import struct
+import sys
 import time
 import os
 
@@ -8,7 +13,29 @@ GRID_WIDTH = 10
 GRID_HEIGHT = 20
 CELL_SIZE = 20
 DELAY = 0.3  # falling speed (seconds) - smaller is faster
-HIGHSCORE_FILE = "highscore.txt"
+FLASH_MS = 50  # line clear flash: time per white/colour phase
+FLASH_PHASES = 6
+HIGHSCORE_FILE = "highscore.txt"  # old format: just the high score, read once to migrate
+SCORES_FILE = "tetris_scores.json"  # high score and leaderboard
+LEADERBOARD_SIZE = 10
+SPAWN_X = 3  # start near the middle
+SPAWN_Y = GRID_HEIGHT - 4  # a bit below top to fit tall pieces
+HARD_DROP_COOLDOWN = 0.1  # seconds; guards against double taps on a new piece
+FRAME_MS = 16  # input is applied and the screen redrawn at most this often
+DAS_MS = 170  # hold a move key this long before it starts repeating
+ARR_MS = 50  # then repeat it this often
+RELEASE_DEBOUNCE_MS = 30  # X11 sends each OS key repeat as a release and a press
+
+# ----- Bot -----
+BOT_WEIGHTS = {"height": -0.51, "lines": 0.76, "holes": -0.36, "bumpiness": -0.18}
+BOT_BEAM_WIDTH = 4  # boards kept per preview depth
+SELF_PLAY_MAX_PIECES = 300  # a good bot never tops out, so games are capped
+
+# ----- Replays -----
+REPLAY_MAGIC = b"TTRP"
+REPLAY_VERSION = 1
+KEYFRAME_ACTIONS = 256  # snapshot the engine after about this many actions
+KEYFRAME_FRAMES = 1024  # or this many frames, whichever comes first
 
 # ----- Shapes (Tetriminoes) -----
 # Each shape is a list of rotations; each rotation is a list of (x, y) offsets
@@ -58,552 +85,1282 @@ COLORS = {
     'Z': 'red'
 }
 
-# ----- Screen setup -----
-screen = turtle.Screen()
-screen.title("Tetris - Turtle Version")
-screen.bgcolor("#2b2b2b")  # Dark Slate Gray
-screen.setup(width=400, height=500)
-screen.tracer(0)
-
-# Draw turtle for blocks
-drawer = turtle.Turtle()
-drawer.hideturtle()
-drawer.penup()
-drawer.speed(0)
-
-# For drawing static background (field border)
-bg_turtle = turtle.Turtle()
-bg_turtle.hideturtle()
-bg_turtle.penup()
-bg_turtle.speed(0)
-
-# For drawing text (score, game over, etc.)
-text_turtle = turtle.Turtle()
-text_turtle.hideturtle()
-text_turtle.penup()
-text_turtle.color("white")
-
-# ----- Game state -----
-# grid[y][x] = color or None
-grid = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-
-current_shape = None
-next_shape = None
-hold_shape = None
-can_hold = True
-current_rotation = 0
-current_x = 3  # start near the middle
-current_y = GRID_HEIGHT - 1  # top of the grid
-score = 0
-level = 1
-game_over = False
-last_drop_time = 0
-high_score = 0
-is_paused = False
-combo_count = -1
-drop_in_progress = False
-
-
-# ----- Helper functions -----
-
-def load_high_score():
-    """Load high score from file."""
-    if os.path.exists(HIGHSCORE_FILE):
-        try:
-            with open(HIGHSCORE_FILE, "r") as f:
-                return int(f.read().strip())
-        except:
-            return 0
-    return 0
-
-def save_high_score():
-    """Save high score to file."""
-    try:
-        with open(HIGHSCORE_FILE, "w") as f:
-            f.write(str(high_score))
-    except:
-        pass
-
-high_score = load_high_score()
-
-
-def get_delay():
-    """Calculate delay based on level."""
-    return max(0.05, 0.3 - (level - 1) * 0.02)
-
-
-def get_ghost_y():
-    """Calculate the y-position where the current piece would land."""
-    if current_shape is None:
-        return current_y
-    ghost_y = current_y
-    while shape_fits(current_shape, current_rotation, current_x, ghost_y - 1):
-        ghost_y -= 1
-    return ghost_y
-
-
-def hold_piece():
-    """Hold the current piece."""
-    global current_shape, hold_shape, next_shape, current_x, current_y, current_rotation, can_hold
-    
-    if game_over or is_paused or not can_hold:
-        return
-
-    if hold_shape is None:
-        hold_shape = current_shape
-        spawn_new_shape()
-    else:
-        current_shape, hold_shape = hold_shape, current_shape
-        current_x = 3
-        current_y = GRID_HEIGHT - 4
-        current_rotation = 0
-    
-    can_hold = False
-    draw_grid()
-
-
-def hard_drop():
-    """Instantly drop the current shape to the bottom."""
-    global current_y, score, last_drop_time, drop_in_progress
-    
-    if drop_in_progress:
-        return
-
-    current_time = time.time()
-    # if game_over or is_paused or current_shape is None or (current_time - last_drop_time < 0.1):
-    if drop_in_progress or game_over or is_paused or current_shape is None or (current_time - last_drop_time < 0.1):
-        return
-        
-    drop_in_progress = True
-    
-    # Check if we can move down at all?
-    # Actually, hard drop should lock even if it can't move down (standard rules).
-    # But for "safety" against accidental double taps on new pieces:
-    # If the piece hasn't dropped due to gravity yet, maybe we shouldn't hard drop?
-    # No, speedrunners do that.
-    
-    while shape_fits(current_shape, current_rotation, current_x, current_y - 1):
-        current_y -= 1
-        score += 2  # Bonus for hard drop
-    
-    draw_grid()
-    place_shape()
-    spawn_new_shape()
-    # spawn_new_shape updates last_drop_time too, resetting the cooldown window.
-    draw_grid()
-    
-    # CRITICAL FIX: Update last_drop_time AFTER the drawing is done.
-    # Turtle drawing can take time. If we rely on the time set in spawn_new_shape(),
-    # the drawing time might eat up the cooldown window.
-    last_drop_time = time.time()
-    drop_in_progress = False
-
-def draw_layout():
-    """Draw the static game board layout."""
-    bg_turtle.clear()
-    
-    # Draw main grid background (Black)
-    # Grid dims: GRID_WIDTH * CELL_SIZE x GRID_HEIGHT * CELL_SIZE
-    # Centered at (0, 0)
-    w = GRID_WIDTH * CELL_SIZE
-    h = GRID_HEIGHT * CELL_SIZE
-    
-    left_x = -w / 2
-    bottom_y = -h / 2
-    
-    bg_turtle.goto(left_x, bottom_y)
-    bg_turtle.color("white", "black")  # White border, Black fill
-    bg_turtle.begin_fill()
-    for _ in range(2):
-        bg_turtle.pendown()
-        bg_turtle.forward(w)
-        bg_turtle.left(90)
-        bg_turtle.forward(h)
-        bg_turtle.left(90)
-    bg_turtle.end_fill()
-    bg_turtle.penup()
-
-def draw_cell(x, y, color):
-    """Draw a single square cell at grid position (x, y)."""
-    screen_x = -GRID_WIDTH * CELL_SIZE / 2 + x * CELL_SIZE
-    screen_y = -GRID_HEIGHT * CELL_SIZE / 2 + y * CELL_SIZE
-    drawer.goto(screen_x, screen_y)
-    drawer.color("gray", color)
-    drawer.begin_fill()
-    for _ in range(4):
-        drawer.pendown()
-        drawer.forward(CELL_SIZE)
-        drawer.left(90)
-    drawer.end_fill()
-    drawer.penup()
-
-
-def draw_grid():
-    """Draw the entire grid: placed blocks + current falling piece."""
-    drawer.clear()
-
-    # Draw placed blocks
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if grid[y][x] is not None:
-                draw_cell(x, y, grid[y][x])
-
-    # Draw current shape
-    if current_shape is not None:
-        shape_cells = SHAPES[current_shape][current_rotation]
-        for (cx, cy) in shape_cells:
-            gx = current_x + cx
-            gy = current_y + cy
-    # Draw Ghost Piece
-    if current_shape is not None:
-        ghost_y = get_ghost_y()
-        shape_cells = SHAPES[current_shape][current_rotation]
-        for (cx, cy) in shape_cells:
-            gx = current_x + cx
-            gy = ghost_y + cy
-            if 0 <= gx < GRID_WIDTH and 0 <= gy < GRID_HEIGHT:
-                # Draw outline for ghost
-                screen_x = -GRID_WIDTH * CELL_SIZE / 2 + gx * CELL_SIZE
-                screen_y = -GRID_HEIGHT * CELL_SIZE / 2 + gy * CELL_SIZE
-                drawer.goto(screen_x, screen_y)
-                drawer.color("gray", "black") # gray outline, black fill
-                drawer.begin_fill()
-                for _ in range(4):
-                    drawer.pendown()
-                    drawer.forward(CELL_SIZE)
-                    drawer.left(90)
-                drawer.end_fill()
-                drawer.penup()
-
-    # Draw current shape
-    if current_shape is not None:
-        shape_cells = SHAPES[current_shape][current_rotation]
-        for (cx, cy) in shape_cells:
-            gx = current_x + cx
-            gy = current_y + cy
-            if 0 <= gx < GRID_WIDTH and 0 <= gy < GRID_HEIGHT:
-                draw_cell(gx, gy, COLORS[current_shape])
-
-    # Draw score and level
-    text_turtle.clear()
-    text_turtle.goto(-180, 210)
-    text_turtle.write(f"Score:\n{score}", font=("Arial", 12, "bold"))
-    
-    text_turtle.goto(-180, 160)
-    text_turtle.write(f"High Score:\n{high_score}", font=("Arial", 12, "bold"))
-
-    text_turtle.goto(-180, 110)
-    text_turtle.write(f"Level: {level}", font=("Arial", 12, "normal"))
-
-    # Draw Next Piece
-    text_turtle.goto(110, 150)
-    text_turtle.write("Next:", font=("Arial", 12, "normal"))
-    
-    if next_shape is not None:
-        preview_x = 120
-        preview_y = 120
-        shape_cells = SHAPES[next_shape][0]
-        for (cx, cy) in shape_cells:
-            screen_x = preview_x + cx * CELL_SIZE
-            screen_y = preview_y + cy * CELL_SIZE
-            
-            drawer.goto(screen_x, screen_y)
-            drawer.color("gray", COLORS[next_shape])
-            drawer.begin_fill()
-            for _ in range(4):
-                drawer.pendown()
-                drawer.forward(CELL_SIZE)
-                drawer.left(90)
-            drawer.end_fill()
-            drawer.penup()
-
-    # Draw Hold Piece
-    text_turtle.goto(-180, 150)
-    text_turtle.write("Hold:", font=("Arial", 12, "normal"))
-    
-    if hold_shape is not None:
-        hold_x = -170
-        hold_y = 120
-        shape_cells = SHAPES[hold_shape][0]
-        for (cx, cy) in shape_cells:
-            screen_x = hold_x + cx * CELL_SIZE
-            screen_y = hold_y + cy * CELL_SIZE
-            
-            drawer.goto(screen_x, screen_y)
-            drawer.color("gray", COLORS[hold_shape])
-            drawer.begin_fill()
-            for _ in range(4):
-                drawer.pendown()
-                drawer.forward(CELL_SIZE)
-                drawer.left(90)
-            drawer.end_fill()
-            drawer.penup()
-
-    # Draw Controls Instructions
-    text_turtle.goto(-190, -150)
-    text_turtle.write("Controls:", font=("Arial", 12, "bold"))
-    text_turtle.goto(-190, -170)
-    text_turtle.write("← → : Move", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -190)
-    text_turtle.write("↑ : Rotate", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -210)
-    text_turtle.write("↓ : Soft Drop", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -230)
-    text_turtle.write("Space : Hard Drop", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -250)
-    text_turtle.write("C : Hold Piece", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -270)
-    text_turtle.write("P : Pause", font=("Arial", 10, "normal"))
-    text_turtle.goto(-190, -290)
-    text_turtle.write("R : Restart", font=("Arial", 10, "normal"))
-
-    if is_paused:
-        text_turtle.goto(-70, 0)
-        text_turtle.write("PAUSED", font=("Arial", 30, "bold"))
-
-    screen.update()
-
-
-def shape_fits(shape, rotation, x, y):
-    """Check if a shape at (x, y) with given rotation fits in grid (no collisions)."""
-    for (cx, cy) in SHAPES[shape][rotation]:
-        gx = x + cx
+# ----- Piece masks -----
+# The board is one int per row (bit x set = column x filled). For every
+# shape, rotation and x offset the piece is precomputed as (dy, row mask)
+# pairs, so collision and line tests are a few bitwise ops.
+FULL_ROW = (1 << GRID_WIDTH) - 1
+
+
+def build_piece_masks():
+    """PIECE_MASKS[shape][rotation][x]: (dy, mask) pairs, missing where a wall is hit."""
+    masks = {}
+    for shape, rotations in SHAPES.items():
+        masks[shape] = []
+        for cells in rotations:
+            rows = {}
+            for (cx, cy) in cells:
+                rows[cy] = rows.get(cy, 0) | (1 << cx)
+            by_x = {}
+            for x in range(-3, GRID_WIDTH):
+                if all(0 <= x + cx < GRID_WIDTH for (cx, _) in cells):
+                    by_x[x] = tuple((cy, mask << x if x >= 0 else mask >> -x)
+                                    for cy, mask in sorted(rows.items()))
+            masks[shape].append(by_x)
+    return masks
+
+PIECE_MASKS = build_piece_masks()
+
+
+def build_piece_profiles():
+    """PIECE_PROFILES[shape][rotation]: (dx, lowest dy, highest dy) per occupied column."""
+    profiles = {}
+    for shape, rotations in SHAPES.items():
+        profiles[shape] = []
+        for cells in rotations:
+            columns = {}
+            for (cx, cy) in cells:
+                low, high = columns.get(cx, (cy, cy))
+                columns[cx] = (min(low, cy), max(high, cy))
+            profiles[shape].append(tuple((cx, low, high)
+                                         for cx, (low, high) in sorted(columns.items())))
+    return profiles
+
+PIECE_PROFILES = build_piece_profiles()
+
+SHAPE_NAMES = list(SHAPES.keys())
+WALL_KICKS = [(1, 0), (-1, 0), (0, 1)]
+ACTIONS = ("left", "right", "down", "rotate", "hard_drop", "hold", "gravity")
+KEY_ACTIONS = {"Left": "left", "Right": "right", "Down": "down", "Up": "rotate",
+               "space": "hard_drop", "c": "hold"}
+REPEAT_ACTIONS = ("left", "right", "down")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+SHAPE_CODES = {name: i + 1 for i, name in enumerate(SHAPE_NAMES)}  # 0 = empty cell
+COLOR_CODES = {COLORS[name]: code for name, code in SHAPE_CODES.items()}
+
+
+# ----- Board helpers -----
+# Pure functions on a board (list of row bitmasks), shared by the engine and the bot.
+def shape_fits(board, shape, rotation, x, y):
+    """Check if a shape at (x, y) with given rotation fits on board (no collisions)."""
+    rows = PIECE_MASKS[shape][rotation].get(x)
+    if rows is None:
+        return False
+    for (cy, mask) in rows:
         gy = y + cy
-        if gx < 0 or gx >= GRID_WIDTH or gy < 0 or gy >= GRID_HEIGHT:
-            return False
-        if grid[gy][gx] is not None:
+        if gy < 0 or gy >= GRID_HEIGHT or board[gy] & mask:
             return False
     return True
 
 
-def place_shape():
-    """Lock the current shape into the grid and check for line clears."""
-    global grid, score, high_score, combo_count
-
-    for (cx, cy) in SHAPES[current_shape][current_rotation]:
-        gx = current_x + cx
-        gy = current_y + cy
-        if 0 <= gy < GRID_HEIGHT and 0 <= gx < GRID_WIDTH:
-            grid[gy][gx] = COLORS[current_shape]
-
-    # Clear full lines
-    full_lines = []
-    for y in range(GRID_HEIGHT):
-        if all(grid[y][x] is not None for x in range(GRID_WIDTH)):
-            full_lines.append(y)
-    
-    if full_lines:
-        # Flash effect
-        for _ in range(3): # Flash 3 times
-            # Turn white
-            for y in full_lines:
-                for x in range(GRID_WIDTH):
-                    draw_cell(x, y, "white")
-            screen.update()
-            time.sleep(0.05)
-            
-            # Turn back (or black/invisible for blink effect)
-            for y in full_lines:
-                for x in range(GRID_WIDTH):
-                    draw_cell(x, y, grid[y][x]) # Draw original color
-            screen.update()
-            time.sleep(0.05)
-            
-        # Draw all lines black before removing (cleanup)
-        for y in full_lines:
-             for x in range(GRID_WIDTH):
-                    draw_cell(x, y, "black")
-        screen.update()
-
-
-    new_grid = []
-    lines_cleared = 0
-    for y in range(GRID_HEIGHT):
-        if y not in full_lines:
-             new_grid.append(grid[y])
+def rotate_with_kicks(board, shape, rotation, x, y):
+    """Rotate clockwise, trying the wall kicks; returns (rotation, x, y) or None."""
+    new_rotation = (rotation + 1) % len(SHAPES[shape])
+    for dx, dy in [(0, 0)] + WALL_KICKS:
+        if shape_fits(board, shape, new_rotation, x + dx, y + dy):
+            return new_rotation, x + dx, y + dy
+    return None
+
+
+def landing_y(board, shape, rotation, x, y):
+    """Lowest y the piece reaches by falling straight down from y."""
+    while shape_fits(board, shape, rotation, x, y - 1):
+        y -= 1
+    return y
+
+
+def column_heights(board):
+    """Height of the highest filled cell in each column (0 for an empty column)."""
+    heights = [0] * GRID_WIDTH
+    remaining = FULL_ROW
+    for y in range(GRID_HEIGHT - 1, -1, -1):
+        found = board[y] & remaining
+        if found:
+            remaining &= ~found
+            for x in range(GRID_WIDTH):
+                if found >> x & 1:
+                    heights[x] = y + 1
+            if not remaining:
+                break
+    return heights
+
+
+def drop_y(board, heights, shape, rotation, x, y):
+    """Landing y of a piece falling from (x, y), given the board's column heights
+
+    Constant time while the piece is above the skyline: it comes to rest on
+    the highest column under it. A piece tucked under an overhang falls
+    back to stepping down one row at a time.
+    """
+    land = max(heights[x + cx] - low for (cx, low, _) in PIECE_PROFILES[shape][rotation])
+    if land <= y:
+        return land
+    return landing_y(board, shape, rotation, x, y)
+
+
+def lock_piece(board, shape, rotation, x, y):
+    """Board after locking a piece at (x, y) and clearing lines; returns (board, lines)."""
+    board = list(board)
+    for (cy, mask) in PIECE_MASKS[shape][rotation][x]:
+        board[y + cy] |= mask
+    if FULL_ROW not in board:
+        return board, 0
+    board = [row for row in board if row != FULL_ROW]
+    lines = GRID_HEIGHT - len(board)
+    return board + [0] * lines, lines
+
+
+# ----- Game rules (no turtle) -----
+MASK64 = (1 << 64) - 1
+# Engine snapshot: rng state, score, lines, pieces, level, combo, current
+# shape/rotation/x/y, next, hold, can_hold, game_over; then one 32-bit word
+# per row holding a 3-bit shape code for each cell
+SNAPSHOT_HEAD = struct.Struct("<QIIIHhBBbbBBBB")
+SNAPSHOT_ROWS = struct.Struct(f"<{GRID_HEIGHT}I")
+SNAPSHOT_SIZE = SNAPSHOT_HEAD.size + SNAPSHOT_ROWS.size
+
+
+class PieceRandom:
+    """SplitMix64: the piece sequence from a single 64-bit state
+
+    random.Random would do, but its state is 2.5 KB; this one fits in a
+    replay keyframe as 8 bytes.
+    """
+    def __init__(self, seed):
+        self.state = seed & MASK64
+
+    def choice(self, seq):
+        self.state = z = (self.state + 0x9E3779B97F4A7C15) & MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+        return seq[(z ^ (z >> 31)) % len(seq)]
+
+
+class TetrisEngine:
+    """The rules of the game with no dependency on turtle
+
+    Advance it with step(action). Things a front end may want to show once
+    (line clears, game over) are appended to self.events as tuples; the
+    consumer clears the list. The piece sequence comes from self.rng, so the
+    same seed and the same actions give the same game.
+    """
+    def __init__(self, seed=None):
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = PieceRandom(seed)
+        # board[y] = bitmask of filled columns; grid[y][x] = color or None, for drawing
+        self.board = [0] * GRID_HEIGHT
+        self.grid = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+        # heights[x] = one above the highest filled cell of column x (the skyline)
+        self.heights = [0] * GRID_WIDTH
+        self.current_shape = None
+        self.next_shape = None
+        self.hold_shape = None
+        self.can_hold = True
+        self.current_rotation = 0
+        self.current_x = SPAWN_X
+        self.current_y = SPAWN_Y
+        self.score = 0
+        self.level = 1
+        self.lines = 0
+        self.pieces = 0
+        self.combo_count = -1
+        self.game_over = False
+        self.events = []
+        self.spawn_new_shape()
+
+    def stats(self):
+        """Summary of the game so far, as stored on the leaderboard."""
+        return {"score": self.score, "lines": self.lines, "pieces": self.pieces,
+                "level": self.level, "seed": self.seed}
+
+    def snapshot(self):
+        """The whole game state as SNAPSHOT_SIZE bytes (events are not included)."""
+        rows = []
+        for row in self.grid:
+            word = 0
+            for x, color in enumerate(row):
+                if color is not None:
+                    word |= COLOR_CODES[color] << (3 * x)
+            rows.append(word)
+        head = SNAPSHOT_HEAD.pack(
+            self.rng.state, self.score, self.lines, self.pieces, self.level,
+            self.combo_count, SHAPE_CODES[self.current_shape], self.current_rotation,
+            self.current_x, self.current_y, SHAPE_CODES[self.next_shape],
+            SHAPE_CODES.get(self.hold_shape, 0), self.can_hold, self.game_over)
+        return head + SNAPSHOT_ROWS.pack(*rows)
+
+    def restore(self, data):
+        """Return to a state saved by snapshot(); the seed is left as it is."""
+        (self.rng.state, self.score, self.lines, self.pieces, self.level,
+         self.combo_count, current, self.current_rotation, self.current_x,
+         self.current_y, next_code, hold, can_hold,
+         game_over) = SNAPSHOT_HEAD.unpack_from(data)
+        self.current_shape = SHAPE_NAMES[current - 1]
+        self.next_shape = SHAPE_NAMES[next_code - 1]
+        self.hold_shape = SHAPE_NAMES[hold - 1] if hold else None
+        self.can_hold = bool(can_hold)
+        self.game_over = bool(game_over)
+        rows = SNAPSHOT_ROWS.unpack_from(data, SNAPSHOT_HEAD.size)
+        for y, word in enumerate(rows):
+            mask = 0
+            for x in range(GRID_WIDTH):
+                code = (word >> (3 * x)) & 7
+                if code:
+                    mask |= 1 << x
+                    self.grid[y][x] = COLORS[SHAPE_NAMES[code - 1]]
+                else:
+                    self.grid[y][x] = None
+            self.board[y] = mask
+        self.heights = column_heights(self.board)
+        self.events = []
+
+    def step(self, action):
+        """Apply one action from ACTIONS; returns True if the state changed."""
+        if self.game_over:
+            return False
+        if action == "left":
+            return self.move(-1, 0)
+        if action == "right":
+            return self.move(1, 0)
+        if action == "down":
+            return self.move(0, -1)
+        if action == "rotate":
+            return self.rotate()
+        if action == "hard_drop":
+            self.hard_drop()
+            return True
+        if action == "hold":
+            return self.hold_piece()
+        if action == "gravity":
+            self.gravity()
+            return True
+        raise ValueError(f"unknown action {action!r}")
+
+    def get_delay(self):
+        """Calculate delay based on level."""
+        return max(0.05, DELAY - (self.level - 1) * 0.02)
+
+    def shape_fits(self, shape, rotation, x, y):
+        """Check if a shape at (x, y) with given rotation fits in grid (no collisions)."""
+        return shape_fits(self.board, shape, rotation, x, y)
+
+    def get_ghost_y(self):
+        """Calculate the y-position where the current piece would land."""
+        return drop_y(self.board, self.heights, self.current_shape,
+                      self.current_rotation, self.current_x, self.current_y)
+
+    def spawn_new_shape(self):
+        """Spawn the next shape at the top and pick a new next shape."""
+        if self.next_shape is None:
+            self.next_shape = self.rng.choice(SHAPE_NAMES)
+        self.current_shape = self.next_shape
+        self.next_shape = self.rng.choice(SHAPE_NAMES)
+        self.current_rotation = 0
+        self.current_x = SPAWN_X
+        self.current_y = SPAWN_Y
+        self.can_hold = True
+        if not self.shape_fits(self.current_shape, self.current_rotation,
+                               self.current_x, self.current_y):
+            self.game_over = True
+            self.events.append(("game_over",))
+
+    def move(self, dx, dy):
+        """Try to move current shape by (dx, dy)."""
+        new_x = self.current_x + dx
+        new_y = self.current_y + dy
+        if not self.shape_fits(self.current_shape, self.current_rotation, new_x, new_y):
+            return False
+        self.current_x = new_x
+        self.current_y = new_y
+        return True
+
+    def rotate(self):
+        """Rotate current shape clockwise, trying the wall kicks if it does not fit."""
+        rotated = rotate_with_kicks(self.board, self.current_shape, self.current_rotation,
+                                    self.current_x, self.current_y)
+        if rotated is None:
+            return False
+        self.current_rotation, self.current_x, self.current_y = rotated
+        return True
+
+    def hold_piece(self):
+        """Hold the current piece."""
+        if not self.can_hold:
+            return False
+        if self.hold_shape is None:
+            self.hold_shape = self.current_shape
+            self.spawn_new_shape()
         else:
-            lines_cleared += 1
-
-    # Add empty rows at the top
-    while len(new_grid) < GRID_HEIGHT:
-        new_grid.append([None for _ in range(GRID_WIDTH)])
-
-    grid = new_grid
-    
-    
-    if lines_cleared > 0:
-        combo_count += 1
-        score += lines_cleared * 100 + (combo_count * 50)
-    else:
-        combo_count = -1
-
-    if score > high_score:
-        high_score = score
-    
-    # helper for update level
-    global level
-    level = 1 + score // 500
-
-
-def spawn_new_shape():
-    """Spawn a new random shape at the top."""
-    global current_shape, current_rotation, current_x, current_y, next_shape, game_over, last_drop_time, can_hold
-    
-    if next_shape is None:
-        next_shape = random.choice(list(SHAPES.keys()))
-        
-    current_shape = next_shape
-    next_shape = random.choice(list(SHAPES.keys()))
-    
-    current_rotation = 0
-    current_x = 3
-    current_y = GRID_HEIGHT - 4  # a bit below top to fit tall pieces
-    
-    # Prevent immediate hard drop of the new piece
-    last_drop_time = time.time()
-
-    if not shape_fits(current_shape, current_rotation, current_x, current_y):
-        game_over = True
-        save_high_score()
-        
-    global can_hold
-    can_hold = True
-
-
-def move(dx, dy):
-    """Try to move current shape by (dx, dy)."""
-    global current_x, current_y
-    if game_over or is_paused or current_shape is None:
-        return
-    new_x = current_x + dx
-    new_y = current_y + dy
-    if shape_fits(current_shape, current_rotation, new_x, new_y):
-        current_x = new_x
-        current_y = new_y
-        draw_grid()
-
-
-def rotate():
-    """Rotate current shape clockwise."""
-    global current_rotation, current_x, current_y
-    if game_over or is_paused or current_shape is None:
+            self.current_shape, self.hold_shape = self.hold_shape, self.current_shape
+            self.current_x = SPAWN_X
+            self.current_y = SPAWN_Y
+            self.current_rotation = 0
+        self.can_hold = False
+        return True
+
+    def hard_drop(self):
+        """Instantly drop the current shape to the bottom and lock it."""
+        ghost_y = self.get_ghost_y()
+        self.score += 2 * (self.current_y - ghost_y)  # Bonus for hard drop
+        self.current_y = ghost_y
+        self.place_shape()
+        self.spawn_new_shape()
+
+    def gravity(self):
+        """Move the piece down one row, or lock it and spawn the next one."""
+        if not self.move(0, -1):
+            self.place_shape()
+            self.spawn_new_shape()
+
+    def place_shape(self):
+        """Lock the current shape into the grid and clear full lines."""
+        shape = self.current_shape
+        for (cy, mask) in PIECE_MASKS[shape][self.current_rotation][self.current_x]:
+            self.board[self.current_y + cy] |= mask
+        for (cx, cy) in SHAPES[shape][self.current_rotation]:
+            self.grid[self.current_y + cy][self.current_x + cx] = COLORS[shape]
+        for (cx, _, high) in PIECE_PROFILES[shape][self.current_rotation]:
+            column = self.current_x + cx
+            self.heights[column] = max(self.heights[column], self.current_y + high + 1)
+        self.pieces += 1
+
+        full_lines = [y for y in range(GRID_HEIGHT) if self.board[y] == FULL_ROW]
+        lines_cleared = len(full_lines)
+        if full_lines:
+            # The rows as they were before the clear, for the front end's flash
+            self.events.append(("lines", full_lines, [list(row) for row in self.grid]))
+            kept = [y for y in range(GRID_HEIGHT) if self.board[y] != FULL_ROW]
+            # Add empty rows at the top
+            self.board = [self.board[y] for y in kept] + [0] * lines_cleared
+            self.grid = ([self.grid[y] for y in kept]
+                         + [[None] * GRID_WIDTH for _ in range(lines_cleared)])
+            # A cleared row can hold a column's top cell, so rescan the skyline
+            self.heights = column_heights(self.board)
+            self.lines += lines_cleared
+            self.combo_count += 1
+            self.score += lines_cleared * 100 + (self.combo_count * 50)
+        else:
+            self.combo_count = -1
+        self.level = 1 + self.score // 500
+
+
+def now_ms():
+    return time.perf_counter() * 1000
+
+
+# ----- Bot -----
+def count_holes(board):
+    """Empty cells with a filled cell somewhere above them."""
+    holes = 0
+    covered = 0
+    for y in range(GRID_HEIGHT - 1, -1, -1):
+        row = board[y]
+        holes += (covered & ~row).bit_count()
+        covered |= row
+    return holes
+
+
+def evaluate_board(board, lines, weights=BOT_WEIGHTS):
+    heights = column_heights(board)
+    bumpiness = sum(abs(heights[i] - heights[i + 1]) for i in range(GRID_WIDTH - 1))
+    return (weights["height"] * sum(heights) + weights["lines"] * lines
+            + weights["holes"] * count_holes(board) + weights["bumpiness"] * bumpiness)
+
+
+def reachable_placements(board, shape):
+    """Every placement reachable from the spawn position
+
+    Searches rotations (with the wall kicks of rotate) and sideways moves
+    breadth first, then hard drops. Returns a list of (actions, board,
+    lines) with the shortest action list for each distinct landing spot.
+    """
+    start = (0, SPAWN_X, SPAWN_Y)
+    if not shape_fits(board, shape, *start):
+        return []
+    paths = {start: []}
+    queue = [start]
+    for state in queue:
+        rotation, x, y = state
+        moves = [("left", (rotation, x - 1, y)), ("right", (rotation, x + 1, y))]
+        rotated = rotate_with_kicks(board, shape, rotation, x, y)
+        if rotated is not None:
+            moves.append(("rotate", rotated))
+        for action, nxt in moves:
+            if nxt not in paths and shape_fits(board, shape, *nxt):
+                paths[nxt] = paths[state] + [action]
+                queue.append(nxt)
+    heights = column_heights(board)
+    placements = {}
+    for (rotation, x, y), path in paths.items():
+        land = drop_y(board, heights, shape, rotation, x, y)
+        key = (rotation, x, land)
+        if key not in placements or len(path) < len(placements[key][0]):
+            new_board, lines = lock_piece(board, shape, rotation, x, land)
+            placements[key] = (path + ["hard_drop"], new_board, lines)
+    return list(placements.values())
+
+
+class TetrisBot:
+    """Picks the actions for the next piece with a beam search over the preview
+
+    The known pieces (current and next, or the hold piece when holding is
+    allowed) are placed in turn, searching both options to the same depth.
+    After each depth only the beam_width best boards by evaluate_board are
+    expanded further.
+    """
+    def __init__(self, weights=BOT_WEIGHTS, beam_width=BOT_BEAM_WIDTH):
+        self.weights = weights
+        self.beam_width = beam_width
+        self.evaluated = 0  # placements scored so far
+
+    def plan(self, engine):
+        """Actions for the current piece, ending with "hard_drop"."""
+        if engine.can_hold and engine.hold_shape is None:
+            # Holding into an empty slot uses up the next piece, so both options
+            # look one piece deep: boards with different piece counts do not compare
+            options = [([], [engine.current_shape]), (["hold"], [engine.next_shape])]
+        else:
+            options = [([], [engine.current_shape, engine.next_shape])]
+            if engine.can_hold:
+                options.append((["hold"], [engine.hold_shape, engine.next_shape]))
+        best_value, best_actions = None, ["hard_drop"]
+        for prefix, shapes in options:
+            result = self.search(engine.board, shapes)
+            if result is not None and (best_value is None or result[0] > best_value):
+                best_value, best_actions = result[0], prefix + result[1]
+        return best_actions
+
+    def search(self, board, shapes):
+        """Best (value, first actions) for placing shapes in order, or None."""
+        beam = [(0.0, board, None, 0)]  # value, board, first actions, lines so far
+        for shape in shapes:
+            candidates = []
+            for _, board, first, lines in beam:
+                for actions, new_board, cleared in reachable_placements(board, shape):
+                    total = lines + cleared
+                    value = evaluate_board(new_board, total, self.weights)
+                    candidates.append((value, new_board, first or actions, total))
+            self.evaluated += len(candidates)
+            if not candidates:
+                break
+            candidates.sort(key=lambda c: -c[0])
+            beam = candidates[:self.beam_width]
+        if beam[0][2] is None:
+            return None
+        return beam[0][0], beam[0][2]
+
+
+def play_bot_game(seed, max_pieces=SELF_PLAY_MAX_PIECES, beam_width=BOT_BEAM_WIDTH):
+    """One headless game played by the bot; returns its stats."""
+    engine = TetrisEngine(seed)
+    bot = TetrisBot(beam_width=beam_width)
+    start = time.perf_counter()
+    while not engine.game_over and engine.pieces < max_pieces:
+        for action in bot.plan(engine):
+            engine.step(action)
+        engine.events.clear()
+    return {"seed": seed, "score": engine.score, "lines": engine.lines,
+            "pieces": engine.pieces, "evaluated": bot.evaluated,
+            "seconds": time.perf_counter() - start, "topped_out": engine.game_over}
+
+
+def self_play(games, workers=None, max_pieces=SELF_PLAY_MAX_PIECES,
+              beam_width=BOT_BEAM_WIDTH, seed=0):
+    """Play games across a process pool and print throughput and score stats."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    seeds = range(seed, seed + games)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(play_bot_game, seeds, [max_pieces] * games,
+                                [beam_width] * games, chunksize=max(1, games // 64)))
+    elapsed = time.perf_counter() - start
+    pieces = sum(r["pieces"] for r in results)
+    evaluated = sum(r["evaluated"] for r in results)
+    scores = sorted(r["score"] for r in results)
+    lines = [r["lines"] for r in results]
+    print(f"{games} games in {elapsed:.1f}s, {pieces / elapsed:.0f} pieces/s, "
+          f"{evaluated / elapsed:.0f} placements/s")
+    print(f"lines/game mean {statistics.mean(lines):.1f} max {max(lines)}, "
+          f"topped out {sum(r['topped_out'] for r in results)}/{games}")
+    quartiles = statistics.quantiles(scores, n=4) if len(scores) > 1 else scores * 3
+    print(f"score min {scores[0]} p25 {quartiles[0]:.0f} median {quartiles[1]:.0f} "
+          f"p75 {quartiles[2]:.0f} max {scores[-1]}")
+    return results
+
+
+# ----- High score -----
+ENTRY_FIELDS = {"score": int, "lines": int, "pieces": int, "level": int, "time": str}
+
+
+def valid_entry(entry):
+    """True if a loaded leaderboard entry has every field lines() shows."""
+    return isinstance(entry, dict) and all(
+        isinstance(entry.get(key), kind) for key, kind in ENTRY_FIELDS.items())
+
+
+class ScoreStore:
+    """High score and a top-N leaderboard of finished games
+
+    The file is written to a temporary file and renamed over the old one,
+    so a crash mid-write never loses the previous scores, and only when
+    its contents actually change. It holds at most LEADERBOARD_SIZE games,
+    so loading it at startup is constant time.
+    """
+    def __init__(self, path=SCORES_FILE, legacy_path=HIGHSCORE_FILE,
+                 size=LEADERBOARD_SIZE):
+        self.path = path
+        self.size = size
+        self.high_score = 0
+        self.leaderboard = []  # dicts, best score first
+        self.saved_text = None
+        self.load(legacy_path)
+
+    def load(self, legacy_path=None):
+        try:
+            with open(self.path) as f:
+                self.saved_text = f.read()
+            data = json.loads(self.saved_text)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            self.high_score = int(data.get("high_score") or 0)
+            entries = data.get("leaderboard") or []
+            if not isinstance(entries, list):
+                raise ValueError("leaderboard is not a list")
+            self.leaderboard = [e for e in entries if valid_entry(e)][:self.size]
+        except FileNotFoundError:
+            if legacy_path and os.path.exists(legacy_path):
+                try:
+                    with open(legacy_path) as f:
+                        self.high_score = int(f.read().strip())
+                except (OSError, ValueError):
+                    pass
+        except (OSError, ValueError, TypeError) as e:
+            print(f"ignoring unreadable {self.path}: {e}", file=sys.stderr)
+
+    def offer(self, score):
+        """Track a running score in memory; nothing is written."""
+        if score > self.high_score:
+            self.high_score = score
+
+    def record_game(self, stats):
+        """Add a finished game's stats to the leaderboard and save if anything changed."""
+        self.offer(stats["score"])
+        entry = dict(stats, time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        if stats["score"] > 0:
+            self.leaderboard.append(entry)
+            self.leaderboard.sort(key=lambda e: -e["score"])
+            del self.leaderboard[self.size:]
+        return self.save()
+
+    def save(self):
+        text = json.dumps({"high_score": self.high_score, "leaderboard": self.leaderboard},
+                          indent=1)
+        if text == self.saved_text:
+            return False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"could not save scores to {self.path}: {e}", file=sys.stderr)
+            return False
+        self.saved_text = text
+        return True
+
+    def lines(self):
+        """The leaderboard as printable lines."""
+        return [f"{rank:2d}. {e['score']:7d}  lines {e['lines']:4d}  pieces {e['pieces']:5d}  "
+                f"level {e['level']:2d}  {e['time']}"
+                for rank, e in enumerate(self.leaderboard, 1)]
+
+
+# ----- Replays -----
+# A replay file is a header, the final engine snapshot, a table of keyframes
+# (frame, stream offset, snapshot) and the action stream. Each stream byte
+# is a 3-bit code and a 5-bit repeat count: codes 0-6 are ACTIONS applied
+# count + 1 times, code 7 ends count + 1 frames. Idle frames therefore cost
+# a byte per 32, and a keyframe always starts at a frame boundary.
+REPLAY_HEADER = struct.Struct("<4sBQIIII")  # magic, version, seed, frames, actions,
+                                            # keyframes, stream length
+KEYFRAME_ENTRY = struct.Struct("<II")  # frame, stream offset; a snapshot follows
+END_FRAME = 7
+
+
+class ReplayRecorder:
+    """Records the actions given to an engine, frame by frame
+
+    Call record() after each engine.step() and end_frame() once per frame.
+    Keyframes are snapshotted every KEYFRAME_ACTIONS actions or
+    KEYFRAME_FRAMES frames, so any frame can be restored by replaying at
+    most that much.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.seed = engine.seed
+        self.stream = bytearray()
+        self.frames = 0
+        self.actions = 0
+        self.idle = 0  # frame ends not written to the stream yet
+        self.last = None  # stream index of this frame's last action byte
+        self.keyframes = [(0, 0, engine.snapshot())]
+        self.keyframe_actions = 0
+        self.saved = False
+
+    def record(self, action):
+        self.flush_idle()
+        code = ACTION_CODES[action]
+        last = self.last
+        if last is not None and self.stream[last] & 7 == code and self.stream[last] >> 3 < 31:
+            self.stream[last] += 8
+        else:
+            self.last = len(self.stream)
+            self.stream.append(code)
+        self.actions += 1
+
+    def end_frame(self):
+        self.frames += 1
+        self.idle += 1
+        self.last = None
+        if (self.actions - self.keyframe_actions >= KEYFRAME_ACTIONS
+                or self.frames - self.keyframes[-1][0] >= KEYFRAME_FRAMES):
+            self.flush_idle()
+            self.keyframes.append((self.frames, len(self.stream), self.engine.snapshot()))
+            self.keyframe_actions = self.actions
+
+    def flush_idle(self):
+        while self.idle:
+            count = min(self.idle, 32)
+            self.stream.append(END_FRAME | (count - 1) << 3)
+            self.idle -= count
+
+    def to_bytes(self):
+        self.flush_idle()
+        parts = [REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.frames,
+                                    self.actions, len(self.keyframes), len(self.stream)),
+                 self.engine.snapshot()]
+        for frame, offset, snapshot in self.keyframes:
+            parts.append(KEYFRAME_ENTRY.pack(frame, offset))
+            parts.append(snapshot)
+        parts.append(bytes(self.stream))
+        return b"".join(parts)
+
+    def save(self, path):
+        """Write the replay atomically, the same way ScoreStore saves."""
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(self.to_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"could not save replay to {path}: {e}", file=sys.stderr)
+            return False
+        self.saved = True
+        return True
+
+
+class Replay:
+    """A replay file loaded into memory."""
+    def __init__(self, seed, frames, actions, final, keyframes, stream):
+        self.seed = seed
+        self.frames = frames
+        self.actions = actions
+        self.final = final  # engine snapshot at the end of the game
+        self.keyframes = keyframes  # [(frame, stream offset, snapshot)], frame 0 first
+        self.keyframe_frames = [k[0] for k in keyframes]
+        self.stream = stream
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            (magic, version, seed, frames, actions, count,
+             length) = REPLAY_HEADER.unpack_from(data)
+            if magic != REPLAY_MAGIC:
+                raise ValueError("not a tetris replay")
+            if version != REPLAY_VERSION:
+                raise ValueError(f"unsupported replay version {version}")
+            pos = REPLAY_HEADER.size
+            final = data[pos:pos + SNAPSHOT_SIZE]
+            pos += SNAPSHOT_SIZE
+            keyframes = []
+            for _ in range(count):
+                frame, offset = KEYFRAME_ENTRY.unpack_from(data, pos)
+                pos += KEYFRAME_ENTRY.size
+                keyframes.append((frame, offset, data[pos:pos + SNAPSHOT_SIZE]))
+                pos += SNAPSHOT_SIZE
+        except struct.error:
+            raise ValueError("truncated replay") from None
+        stream = data[pos:pos + length]
+        if len(stream) != length or not keyframes or len(final) != SNAPSHOT_SIZE:
+            raise ValueError("truncated replay")
+        return cls(seed, frames, actions, final, keyframes, stream)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayPlayer:
+    """Plays a Replay into its own TetrisEngine, forwards or by seeking."""
+    def __init__(self, replay):
+        self.replay = replay
+        self.engine = TetrisEngine(replay.seed)
+        self.frame = 0  # frames played so far
+        self.offset = 0  # next stream byte
+        self.idle = 0  # frames left of the current END_FRAME run
+
+    @property
+    def finished(self):
+        return self.frame >= self.replay.frames
+
+    def advance(self):
+        """Play one frame's actions."""
+        if self.idle:
+            self.idle -= 1
+            self.frame += 1
+            return
+        stream = self.replay.stream
+        engine = self.engine
+        while self.offset < len(stream):
+            byte = stream[self.offset]
+            self.offset += 1
+            code = byte & 7
+            if code == END_FRAME:
+                self.idle = byte >> 3
+                break
+            action = ACTIONS[code]
+            for _ in range((byte >> 3) + 1):
+                engine.step(action)
+        self.frame += 1
+
+    def seek(self, frame):
+        """Go to the start of frame; costs at most one keyframe interval of replaying."""
+        replay = self.replay
+        frame = max(0, min(frame, replay.frames))
+        i = bisect.bisect_right(replay.keyframe_frames, frame) - 1
+        key_frame, offset, snapshot = replay.keyframes[i]
+        if not key_frame <= self.frame <= frame:
+            self.engine.restore(snapshot)
+            self.frame = key_frame
+            self.offset = offset
+            self.idle = 0
+        while self.frame < frame:
+            self.advance()
+        self.engine.events.clear()
+
+    def verify(self):
+        """Replay the whole game from the seed, checking every keyframe and the end.
+
+        Returns the first frame whose state differs from the file, or None.
+        """
+        self.engine.reset(self.replay.seed)
+        self.frame = self.offset = self.idle = 0
+        for key_frame, _, snapshot in self.replay.keyframes:
+            while self.frame < key_frame:
+                self.advance()
+            if self.engine.snapshot() != snapshot:
+                return key_frame
+        while not self.finished:
+            self.advance()
+        if self.engine.snapshot() != self.replay.final:
+            return self.frame
+        return None
+
+
+# ----- Turtle front end -----
+class TurtleTetris:
+    """Draws a TetrisEngine with turtle and feeds it the keyboard
+
+    Every board and preview cell is one persistent rectangle on the turtle
+    canvas. A frame only recolours the cells whose look changed, so redraw
+    cost does not grow with the number of locked blocks. With record_path
+    each game's replay is saved there when it ends, replacing the last one.
+    """
+    CONTROLS = ["← → : Move", "↑ : Rotate", "↓ : Soft Drop", "Space : Hard Drop",
+                "C : Hold Piece", "P : Pause", "R : Restart"]
+    GAME_OVER_HINT = "Press 'r' to restart"
+
+    def __init__(self, turtle, engine, record_path=None):
+        self.turtle = turtle
+        self.engine = engine
+        self.record_path = record_path
+        self.recorder = None
+        self.new_recording()
+        self.scores = ScoreStore()
+        self.recorded = False  # this game is on the leaderboard already
+        self.is_paused = False
+        self.last_drop_time = time.time()
+        self.pieces_seen = 0
+        self.flash_rows = []  # cleared rows while their flash plays
+        self.flash_grid = None  # the colours from before that clear
+        self.flash_pieces = 0  # engine.pieces when it started; a later lock ends it
+        self.flash_phase = 0
+        self.flash_id = 0
+        self.pressed = []  # actions of new key presses since the last frame
+        self.held = {}  # action -> time (ms) of its next auto-repeat
+        self.releasing = {}  # action -> token of its pending release check
+        self.release_token = 0
+        self.next_gravity = 0
+        self.dirty = True  # the screen is out of date
+
+        # ----- Screen setup -----
+        self.screen = screen = turtle.Screen()
+        screen.title("Tetris - Turtle Version")
+        screen.bgcolor("#2b2b2b")  # Dark Slate Gray
+        screen.setup(width=400, height=500)
+        screen.tracer(0)
+
+        # For drawing static background (field border)
+        self.bg_turtle = self.make_turtle()
+        # For drawing text (score, game over, etc.)
+        self.text_turtle = self.make_turtle("white")
+        # For the labels and controls, written once
+        self.hud_turtle = self.make_turtle("white")
+
+        self.canvas = screen.getcanvas()
+        self.cell_items = {}  # key -> canvas rectangle id
+        self.cell_looks = {}  # key -> (fill, outline) on screen, None when hidden
+        self.hud_drawn = None  # values shown by text_turtle
+
+        self.draw_layout()
+        self.draw_hud()
+        self.create_cells()
+        self.bind_keys()
+
+    def make_turtle(self, color=None):
+        t = self.turtle.Turtle()
+        t.hideturtle()
+        t.penup()
+        t.speed(0)
+        if color is not None:
+            t.color(color)
+        return t
+
+    # ----- Input controls -----
+    # Key handlers only record state. frame() applies it once per display
+    # frame, with delayed auto-shift (DAS) and auto-repeat rate (ARR) for
+    # held keys, so OS key repeat cannot outpace rendering.
+    def bind_keys(self):
+        screen = self.screen
+        screen.listen()
+        for key, action in KEY_ACTIONS.items():
+            screen.onkeypress(lambda action=action: self.press(action), key)
+            screen.onkeyrelease(lambda action=action: self.release(action), key)
+        screen.onkey(self.toggle_pause, "p")
+        screen.onkey(self.toggle_pause, "P")
+        screen.onkey(self.reset_game, "r")
+
+    def press(self, action):
+        if self.releasing.pop(action, None) is not None:
+            return  # the release was half of an OS auto-repeat; cancel it
+        if action in self.held:
+            return  # OS auto-repeat; DAS/ARR does the repeating
+        self.held[action] = now_ms() + DAS_MS
+        self.pressed.append(action)
+
+    def release(self, action):
+        """Let go of a key only if no press for it follows within RELEASE_DEBOUNCE_MS."""
+        self.release_token += 1
+        token = self.release_token
+        self.releasing[action] = token
+        self.screen.ontimer(lambda: self.finish_release(action, token), RELEASE_DEBOUNCE_MS)
+
+    def finish_release(self, action, token):
+        if self.releasing.get(action) == token:
+            del self.releasing[action]
+            self.held.pop(action, None)
+
+    def act(self, action):
+        """Send one action to the engine; the next frame redraws if anything changed."""
+        if action == "hard_drop":
+            if time.time() - self.last_drop_time < HARD_DROP_COOLDOWN:
+                return
+            self.last_drop_time = time.time()
+        if self.engine.step(action):
+            if self.recorder is not None:
+                self.recorder.record(action)
+            self.after_step()
+
+    def toggle_pause(self):
+        if self.engine.game_over:
+            return
+        self.is_paused = not self.is_paused
+        self.next_gravity = now_ms() + self.engine.get_delay() * 1000
+        self.dirty = True
+
+    def after_step(self):
+        """Handle engine events and mark the frame for redrawing."""
+        engine = self.engine
+        for event in engine.events:
+            if event[0] == "lines":
+                # The clear is committed already; the flash only replays the old rows
+                self.start_line_flash(event[1], event[2])
+            elif event[0] == "game_over":
+                self.record_game()
+        engine.events.clear()
+        if engine.pieces != self.pieces_seen:
+            # A new piece cannot be hard dropped straight away
+            self.pieces_seen = engine.pieces
+            self.last_drop_time = time.time()
+        self.scores.offer(engine.score)
+        self.dirty = True
+
+    def record_game(self):
+        if not self.recorded:
+            self.recorded = True
+            self.scores.record_game(self.engine.stats())
+
+    def new_recording(self):
+        if self.record_path:
+            self.recorder = ReplayRecorder(self.engine)
+
+    def save_replay(self):
+        recorder = self.recorder
+        if recorder is not None and not recorder.saved and recorder.actions:
+            recorder.save(self.record_path)
+
+    def reset_game(self):
+        """Reset the game state to start over."""
+        if self.engine.score > 0:
+            self.record_game()  # an abandoned game still counts
+        self.save_replay()
+        self.engine.reset()
+        self.new_recording()
+        self.recorded = False
+        self.is_paused = False
+        self.flash_rows = []
+        self.pressed.clear()
+        self.last_drop_time = time.time()
+        self.pieces_seen = 0
+        self.next_gravity = now_ms() + self.engine.get_delay() * 1000
+        self.dirty = True
+
+    # ----- Game loop -----
+    def start(self):
+        self.next_gravity = now_ms() + self.engine.get_delay() * 1000
+        self.dirty = True
+        self.frame()
+
+    def frame(self):
+        """Apply input, repeats and gravity, then draw at most once."""
+        now = now_ms()
+        if not self.is_paused and not self.engine.game_over:
+            for action in self.pressed:
+                self.act(action)
+            for action, due in self.held.items():
+                if action in REPEAT_ACTIONS and now >= due:
+                    # At most one repeat per frame, however late the frame is
+                    self.act(action)
+                    self.held[action] = now + ARR_MS
+            if now >= self.next_gravity:
+                self.act("gravity")
+                self.next_gravity = now + self.engine.get_delay() * 1000
+        self.pressed.clear()
+        if self.recorder is not None:
+            self.recorder.end_frame()
+            if self.engine.game_over:
+                self.save_replay()
+        if self.dirty:
+            self.dirty = False
+            self.draw_grid()
+        self.screen.ontimer(self.frame, FRAME_MS)
+
+    # ----- Drawing -----
+    def draw_layout(self):
+        """Draw the static game board layout."""
+        bg_turtle = self.bg_turtle
+        bg_turtle.clear()
+
+        # Draw main grid background (Black)
+        # Grid dims: GRID_WIDTH * CELL_SIZE x GRID_HEIGHT * CELL_SIZE
+        # Centered at (0, 0)
+        w = GRID_WIDTH * CELL_SIZE
+        h = GRID_HEIGHT * CELL_SIZE
+
+        left_x = -w / 2
+        bottom_y = -h / 2
+
+        bg_turtle.goto(left_x, bottom_y)
+        bg_turtle.color("white", "black")  # White border, Black fill
+        bg_turtle.begin_fill()
+        for _ in range(2):
+            bg_turtle.pendown()
+            bg_turtle.forward(w)
+            bg_turtle.left(90)
+            bg_turtle.forward(h)
+            bg_turtle.left(90)
+        bg_turtle.end_fill()
+        bg_turtle.penup()
+
+    def create_cell(self, screen_x, screen_y):
+        """Create a hidden cell rectangle at turtle coordinates (screen_x, screen_y)."""
+        # The turtle canvas has its y axis flipped
+        return self.canvas.create_rectangle(screen_x, -screen_y - CELL_SIZE,
+                                            screen_x + CELL_SIZE, -screen_y,
+                                            state="hidden")
+
+    def create_cells(self):
+        """Create the rectangles for the board and the next/hold previews."""
+        for y in range(GRID_HEIGHT):
+            for x in range(GRID_WIDTH):
+                self.cell_items[x, y] = self.create_cell(
+                    -GRID_WIDTH * CELL_SIZE / 2 + x * CELL_SIZE,
+                    -GRID_HEIGHT * CELL_SIZE / 2 + y * CELL_SIZE)
+        for name, left, bottom in (("next", 120, 120), ("hold", -170, 120)):
+            for cy in range(4):
+                for cx in range(4):
+                    self.cell_items[name, cx, cy] = self.create_cell(
+                        left + cx * CELL_SIZE, bottom + cy * CELL_SIZE)
+
+    def paint_cell(self, key, look):
+        """Give one cell a (fill, outline) look, or hide it with None."""
+        if self.cell_looks.get(key) == look:
+            return
+        self.cell_looks[key] = look
+        if look is None:
+            self.canvas.itemconfig(self.cell_items[key], state="hidden")
+        else:
+            self.canvas.itemconfig(self.cell_items[key], state="normal",
+                                   fill=look[0], outline=look[1])
+
+    def start_line_flash(self, rows, grid):
+        """Flash the cleared rows of the pre-clear grid without blocking input."""
+        self.flash_rows = rows
+        self.flash_grid = grid
+        self.flash_pieces = self.engine.pieces
+        self.flash_phase = 0
+        self.flash_id += 1
+        animation_id = self.flash_id
+        self.screen.ontimer(lambda: self.flash_step(animation_id), FLASH_MS)
+
+    def flash_step(self, animation_id):
+        """Advance the line flash; stale timers from an older flash do nothing."""
+        if animation_id != self.flash_id or not self.flash_rows:
+            return
+        self.flash_phase += 1
+        if self.flash_phase >= FLASH_PHASES:
+            self.flash_rows = []
+        else:
+            self.screen.ontimer(lambda: self.flash_step(animation_id), FLASH_MS)
+        self.dirty = True
+
+    def draw_hud(self):
+        """Draw the labels and controls that never change; called once."""
+        hud_turtle = self.hud_turtle
+        hud_turtle.clear()
+        hud_turtle.goto(110, 150)
+        hud_turtle.write("Next:", font=("Arial", 12, "normal"))
+        hud_turtle.goto(-180, 150)
+        hud_turtle.write("Hold:", font=("Arial", 12, "normal"))
+        hud_turtle.goto(-190, -150)
+        hud_turtle.write("Controls:", font=("Arial", 12, "bold"))
+        for i, line in enumerate(self.CONTROLS):
+            hud_turtle.goto(-190, -170 - i * 20)
+            hud_turtle.write(line, font=("Arial", 10, "normal"))
+
+    def draw_status(self):
+        """Rewrite score, level and the pause/game over banners when they change."""
+        engine = self.engine
+        values = (engine.score, self.scores.high_score, engine.level, self.is_paused,
+                  engine.game_over)
+        if values == self.hud_drawn:
+            return
+        self.hud_drawn = values
+        text_turtle = self.text_turtle
+        text_turtle.clear()
+        text_turtle.goto(-180, 210)
+        text_turtle.write(f"Score:\n{engine.score}", font=("Arial", 12, "bold"))
+        text_turtle.goto(-180, 160)
+        text_turtle.write(f"High Score:\n{self.scores.high_score}",
+                          font=("Arial", 12, "bold"))
+        text_turtle.goto(-180, 110)
+        text_turtle.write(f"Level: {engine.level}", font=("Arial", 12, "normal"))
+        if self.is_paused:
+            text_turtle.goto(-70, 0)
+            text_turtle.write("PAUSED", font=("Arial", 30, "bold"))
+        if engine.game_over:
+            text_turtle.goto(-80, 0)
+            text_turtle.write("GAME OVER", font=("Arial", 24, "bold"))
+            text_turtle.goto(-100, -30)
+            text_turtle.write(self.GAME_OVER_HINT, font=("Arial", 14, "normal"))
+
+    def draw_grid(self):
+        """Bring the screen up to date: placed blocks, ghost, current piece, previews."""
+        engine = self.engine
+        # While a line flash plays the board is shown as it was before the
+        # clear, so rows only collapse when the flash ends
+        flashing = self.flash_rows and self.flash_pieces == engine.pieces
+        grid = self.flash_grid if flashing else engine.grid
+        looks = {}
+        for y in range(GRID_HEIGHT):
+            row = grid[y]
+            for x in range(GRID_WIDTH):
+                looks[x, y] = None if row[x] is None else (row[x], "gray")
+
+        if flashing:
+            # Cleared rows alternate between white and their old colours
+            for y in self.flash_rows:
+                for x in range(GRID_WIDTH):
+                    looks[x, y] = (("white", "gray") if self.flash_phase % 2 == 0
+                                   else (grid[y][x], "gray"))
+
+        if not engine.game_over:
+            shape_cells = SHAPES[engine.current_shape][engine.current_rotation]
+            x, y = engine.current_x, engine.current_y
+            if not flashing:
+                # Ghost piece: gray outline, black fill; it needs the collapsed board
+                ghost_y = engine.get_ghost_y()
+                for (cx, cy) in shape_cells:
+                    if (x + cx, ghost_y + cy) in looks:
+                        looks[x + cx, ghost_y + cy] = ("black", "gray")
+            for (cx, cy) in shape_cells:
+                if (x + cx, y + cy) in looks:
+                    looks[x + cx, y + cy] = (COLORS[engine.current_shape], "gray")
+
+        for name, shape in (("next", engine.next_shape), ("hold", engine.hold_shape)):
+            for cy in range(4):
+                for cx in range(4):
+                    looks[name, cx, cy] = None
+            if shape is not None:
+                for (cx, cy) in SHAPES[shape][0]:
+                    looks[name, cx, cy] = (COLORS[shape], "gray")
+
+        for key, look in looks.items():
+            self.paint_cell(key, look)
+        self.draw_status()
+        self.screen.update()
+
+
+class ReplayTetris(TurtleTetris):
+    """Shows a ReplayPlayer's game instead of taking keyboard input
+
+    speed is replay frames per display frame and may be fractional. Seeking
+    goes through the player's keyframes, so jumps cost the same anywhere in
+    the game.
+    """
+    CONTROLS = ["↑ ↓ : Speed x2 / x½", "← → : Seek 5 s", "P : Pause"]
+    GAME_OVER_HINT = "End of replay"
+    SEEK_FRAMES = 5000 // FRAME_MS
+
+    def __init__(self, turtle, player, speed=1.0):
+        self.player = player
+        self.set_speed(speed)
+        self.credit = 0.0  # replay frames owed to the display
+        super().__init__(turtle, player.engine)
+
+    def bind_keys(self):
+        screen = self.screen
+        screen.listen()
+        screen.onkey(lambda: self.set_speed(self.speed * 2), "Up")
+        screen.onkey(lambda: self.set_speed(self.speed / 2), "Down")
+        screen.onkey(lambda: self.seek(-self.SEEK_FRAMES), "Left")
+        screen.onkey(lambda: self.seek(self.SEEK_FRAMES), "Right")
+        screen.onkey(self.toggle_pause, "p")
+        screen.onkey(self.toggle_pause, "P")
+
+    def set_speed(self, speed):
+        self.speed = min(64.0, max(0.125, speed))
+
+    def seek(self, frames):
+        self.player.seek(self.player.frame + frames)
+        self.flash_rows = []
+        self.credit = 0.0
+        self.dirty = True
+
+    def toggle_pause(self):
+        self.is_paused = not self.is_paused
+        self.dirty = True
+
+    def frame(self):
+        """Play the frames due at the current speed, then draw at most once."""
+        player = self.player
+        if not self.is_paused and not player.finished:
+            self.credit += self.speed
+            while self.credit >= 1 and not player.finished:
+                player.advance()
+                self.credit -= 1
+                self.dirty = True
+            engine = self.engine
+            for event in engine.events:
+                if event[0] == "lines":
+                    self.start_line_flash(event[1], event[2])
+            engine.events.clear()
+        if self.dirty:
+            self.dirty = False
+            self.draw_grid()
+        self.screen.ontimer(self.frame, FRAME_MS)
+
+
+# ----- Main -----
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tetris")
+    parser.add_argument("--seed", type=int, help="seed for a reproducible piece sequence")
+    parser.add_argument("--selfplay", type=int, metavar="GAMES",
+                        help="let the bot play GAMES headless games and report stats")
+    parser.add_argument("--workers", type=int, help="processes for --selfplay")
+    parser.add_argument("--max-pieces", type=int, default=SELF_PLAY_MAX_PIECES,
+                        help="piece cap per --selfplay game")
+    parser.add_argument("--beam", type=int, default=BOT_BEAM_WIDTH,
+                        help="bot beam width")
+    parser.add_argument("--scores", action="store_true", help="print the leaderboard")
+    parser.add_argument("--record", metavar="PATH",
+                        help="save each game's replay to PATH (the latest game wins)")
+    parser.add_argument("--replay", metavar="PATH", help="watch a saved replay")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay frames per display frame for --replay")
+    parser.add_argument("--seek", type=int, default=0, metavar="FRAME",
+                        help="start --replay at FRAME")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-run --replay headless and check it matches the recording")
+    args = parser.parse_args(argv)
+
+    if args.scores:
+        store = ScoreStore()
+        print(f"high score {store.high_score}")
+        print("\n".join(store.lines()))
         return
-    new_rotation = (current_rotation + 1) % len(SHAPES[current_shape])
-    if shape_fits(current_shape, new_rotation, current_x, current_y):
-        current_rotation = new_rotation
-        draw_grid()
-    else:
-        # Wall Kicks
-        for dx, dy in [(1, 0), (-1, 0), (0, 1)]:
-             if shape_fits(current_shape, new_rotation, current_x + dx, current_y + dy):
-                 current_x += dx
-                 current_y += dy
-                 current_rotation = new_rotation
-                 draw_grid()
-                 return
-
-
-# ----- Input controls -----
-
-def move_left():
-    move(-1, 0)
-
-
-def move_right():
-    move(1, 0)
 
-
-def move_down():
-    move(0, -1)
-
-
-def rotate_shape():
-    rotate()
-
-
-def toggle_pause():
-    global is_paused
-    if game_over:
-        return
-    is_paused = not is_paused
-    draw_grid()
-    if not is_paused:
-        game_loop()
-
-
-screen.listen()
-screen.onkey(move_left, "Left")
-screen.onkey(move_right, "Right")
-screen.onkey(move_down, "Down")
-screen.onkey(rotate_shape, "Up")
-screen.onkey(hard_drop, "space")
-screen.onkey(hold_piece, "c")
-screen.onkey(toggle_pause, "p")
-screen.onkey(toggle_pause, "P")
-
-
-def reset_game():
-    """Reset the game state to start over."""
-    global grid, score, level, game_over, current_shape, next_shape, hold_shape, can_hold, high_score, is_paused, combo_count, drop_in_progress
-    
-    save_high_score() # save previous game score
-    high_score = load_high_score()
-    
-    grid = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    score = 0
-    combo_count = -1
-    level = 1
-    game_over = False
-    is_paused = False
-    drop_in_progress = False
-    current_shape = None
-    next_shape = None
-    hold_shape = None
-    can_hold = True
-    
-    spawn_new_shape()
-    draw_grid()
-    game_loop()
-
-screen.onkey(reset_game, "r")
-
-
-# ----- Game loop -----
-def game_loop():
-    global current_y, game_over
-    
-    if is_paused:
+    if args.selfplay:
+        self_play(args.selfplay, args.workers, args.max_pieces, args.beam, args.seed or 0)
         return
 
-    if game_over:
-        text_turtle.goto(-80, 0)
-        text_turtle.write("GAME OVER", font=("Arial", 24, "bold"))
-        text_turtle.goto(-100, -30)
-        text_turtle.write("Press 'r' to restart", font=("Arial", 14, "normal"))
-        save_high_score()
-        screen.update()
+    if args.replay:
+        if args.speed <= 0:
+            parser.error("--speed must be positive")
+        try:
+            player = ReplayPlayer(Replay.load(args.replay))
+        except (OSError, ValueError) as e:
+            sys.exit(f"cannot read replay {args.replay}: {e}")
+        if args.verify:
+            frame = player.verify()
+            if frame is not None:
+                sys.exit(f"replay differs from the recording at frame {frame}")
+            stats = player.engine.stats()
+            print(f"replay ok: score {stats['score']}  lines {stats['lines']}  "
+                  f"pieces {stats['pieces']}  frames {player.frame}")
+            return
+        player.seek(args.seek)
+        import turtle
+        ReplayTetris(turtle, player, args.speed).start()
+        turtle.done()
         return
 
-    if current_shape is None:
-        spawn_new_shape()
-
-    # Try to move down
-    if shape_fits(current_shape, current_rotation, current_x, current_y - 1):
-        current_y -= 1
-    else:
-        # Lock shape and spawn new one
-        place_shape()
-        spawn_new_shape()
-
-    draw_grid()
-    screen.ontimer(game_loop, int(get_delay() * 1000))
-
-
-# Start the game
-spawn_new_shape()
-draw_layout()
-draw_grid()
-game_loop()
+    import turtle
+    game = TurtleTetris(turtle, TetrisEngine(args.seed), args.record)
+    game.start()
+    turtle.done()
 
-turtle.done()
 
+if __name__ == "__main__":
+    main()